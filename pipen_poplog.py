@@ -1,12 +1,27 @@
 """Populate logs from stdout/stderr to pipen runnning logs"""
 
 from __future__ import annotations
-from typing import TYPE_CHECKING
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Awaitable,
+    Callable,
+    Iterable,
+    Mapping,
+    Sequence,
+)
 
 import os
+import hashlib
+import heapq
 import re
+import shlex
+import signal
+import asyncio
 import logging
 import time
+import zlib
+from abc import ABC, abstractmethod
 from pathlib import Path
 from contextlib import suppress
 from panpath import PanPath, CloudPath
@@ -14,6 +29,8 @@ from pipen.pluginmgr import plugin
 from pipen.utils import get_logger
 
 if TYPE_CHECKING:
+    from argparse import Namespace
+    from argx import ArgumentParser
     from pipen import Pipen, Proc
     from pipen.job import Job
 
@@ -21,6 +38,88 @@ __version__ = "1.1.6"
 PATTERN = r"\[PIPEN-POPLOG\]\[(?P<level>\w+?)\] (?P<message>.*)"
 logger = get_logger("poplog")
 levels = {"warn": "warning"}
+# The named groups, backreferences and conditional groups of each rule, renamed
+# so that the rules can live in a single combined regex
+GROUP_REF = re.compile(r"\(\?(P<|P=|\()(\w+)([>)])")
+# Leading global flags (e.g. `(?i)`), to be scoped to the rule
+GLOBAL_FLAGS = re.compile(r"^\(\?([aiLmsux]+)\)")
+
+
+def _base_logger() -> logging.Logger:
+    """Get the underlying logger of the poplog logger adapter"""
+    return logger.logger
+
+
+def _prefix_groups(pattern: str, prefix: str) -> str:
+    """Prefix the names of the groups in a pattern, as well as the names in the
+    backreferences and the conditional groups
+
+    The escaped characters and the character classes are left as is.
+
+    Raises:
+        ValueError: If the pattern refers to the groups by numbers, which
+            would be shifted in a combined regex
+    """
+    out = []
+    i, n = 0, len(pattern)
+    while i < n:
+        char = pattern[i]
+        if char == "\\":
+            if pattern[i + 1 : i + 2] in tuple("123456789"):
+                raise ValueError(
+                    f"Invalid poplog_rules: {pattern!r}, numbered "
+                    "backreferences are not supported with multiple rules, "
+                    "use named ones (`(?P=name)`) instead."
+                )
+            out.append(pattern[i : i + 2])
+            i += 2
+        elif char == "[":
+            # a leading "]" (after an optional "^") is a literal
+            j = i + 1
+            if pattern[j : j + 1] == "^":
+                j += 1
+            if pattern[j : j + 1] == "]":
+                j += 1
+            while j < n and pattern[j] != "]":
+                j += 2 if pattern[j] == "\\" else 1
+            out.append(pattern[i : j + 1])
+            i = j + 1
+        else:
+            ref = GROUP_REF.match(pattern, i)
+            if ref is None:
+                out.append(char)
+                i += 1
+            elif ref[1] == "(" and ref[2].isdigit():
+                raise ValueError(
+                    f"Invalid poplog_rules: {pattern!r}, numbered conditional "
+                    "groups are not supported with multiple rules, use named "
+                    "ones (`(?(name)...)`) instead."
+                )
+            else:
+                out.append(f"(?{ref[1]}{prefix}{ref[2]}{ref[3]}")
+                i = ref.end()
+
+    return "".join(out)
+
+
+def _rule_logger(
+    name: str | logging.LoggerAdapter | None,
+) -> logging.LoggerAdapter:
+    """Get the logger for a rule, the poplog logger is used if name is None"""
+    if name is None:
+        return logger
+    if isinstance(name, str):
+        return get_logger(name, level=_base_logger().getEffectiveLevel())
+    return name
+
+
+def _fsync_handlers(handlers: Iterable[logging.Handler]) -> None:
+    """Flush the streams of the handlers and fsync them"""
+    for h in handlers:
+        with suppress(Exception):
+            h.stream.flush()
+            # This will force the mounting tool (e.g. gcsfuse) to upload the data
+            os.fsync(h.stream.fileno())
 
 
 class Singleton(type):
@@ -51,6 +150,737 @@ class Singleton(type):
         return cls._instances[cls]
 
 
+class PoplogRule:
+    """A rule to route the matched lines to a logger
+
+    Attributes:
+        pattern (str):
+            The regular expression to match the lines. Named groups `level` and
+            `message` are used to extract the level and the message. If `level`
+            is not captured, `level` of the rule is used. If `message` is not
+            captured, the whole matched text is used.
+        level (str | None):
+            The level to use when the pattern does not capture one, or to
+            override the captured one when `force_level` is True.
+        force_level (bool):
+            Whether to always use `level` instead of the captured one.
+        logger (logging.LoggerAdapter):
+            The logger to log the messages with.
+        drop (bool):
+            Whether to drop the matched lines (not log them at all).
+    """
+
+    __slots__ = (
+        "pattern",
+        "level",
+        "force_level",
+        "logger",
+        "drop",
+        "has_level",
+        "has_message",
+    )
+
+    def __init__(
+        self,
+        pattern: str,
+        level: str | None = None,
+        force_level: bool = False,
+        logger: str | logging.LoggerAdapter | None = None,
+        drop: bool = False,
+    ) -> None:
+        self.pattern = pattern
+        self.level = level.lower() if level else None
+        self.force_level = force_level
+        self.logger = _rule_logger(logger)
+        self.drop = drop
+        groupindex = re.compile(pattern).groupindex
+        self.has_level = "level" in groupindex
+        self.has_message = "message" in groupindex
+
+    @classmethod
+    def from_spec(cls, spec: str | Mapping[str, Any] | PoplogRule) -> PoplogRule:
+        """Create a rule from a pattern or a dict of arguments"""
+        if isinstance(spec, PoplogRule):
+            return spec
+        if isinstance(spec, str):
+            return cls(spec)
+        return cls(**spec)
+
+
+class PoplogMatcher:
+    """Match the lines against multiple rules with a single regex
+
+    With multiple rules, the patterns are compiled into one alternation, each
+    wrapped in a named branch (`_r<i>`), with the named groups renamed to
+    `_r<i>_<name>` and the leading global flags (e.g. `(?i)`) scoped to the
+    branch. So that each line is scanned only once and `match.lastgroup` tells
+    which rule it is matched against. A single rule is compiled as is.
+
+    The level names are resolved to level numbers with a table precomputed when
+    the matcher is created (including the custom levels registered by
+    `logging.addLevelName()` and the aliases in `levels`), and the lines with
+    levels below the threshold of the logger of the rule are dropped right after
+    matching, before the message is extracted and formatted. Unknown level names
+    fall back to the `level` of the rule, or INFO.
+
+    Note that numbered backreferences (e.g. `\\1`) and conditional groups (e.g.
+    `(?(1)...)`) are not supported in the patterns with multiple rules, use
+    named ones (`(?P=name)`, `(?(name)...)`) instead.
+
+    Attributes:
+        rules (list[PoplogRule]): The rules
+        regex (re.Pattern): The combined regex
+        levelnos (dict[str, int]): The table of lowercased level names to numbers
+        thresholds (list[int]): The effective levels of the loggers of the rules
+    """
+
+    __slots__ = ("rules", "regex", "levelnos", "thresholds")
+
+    def __init__(
+        self,
+        rules: Sequence[str | Mapping[str, Any] | PoplogRule],
+    ) -> None:
+        self.rules = [PoplogRule.from_spec(rule) for rule in rules]
+        if len(self.rules) == 1:
+            self.regex = re.compile(self.rules[0].pattern)
+        else:
+            self.regex = self._combine(self.rules)
+        self.levelnos = {
+            name.lower(): levelno
+            for name, levelno in logging._nameToLevel.items()
+        }
+        for alias, name in levels.items():
+            self.levelnos[alias] = self.levelnos[name]
+        self.thresholds = [rule.logger.getEffectiveLevel() for rule in self.rules]
+
+    @staticmethod
+    def _combine(rules: Sequence[PoplogRule]) -> re.Pattern:
+        """Compile the patterns of the rules into one alternation"""
+        branches = []
+        for i, rule in enumerate(rules):
+            pattern = _prefix_groups(rule.pattern, f"_r{i}_")
+            flags = GLOBAL_FLAGS.match(pattern)
+            if flags:
+                pattern = f"(?{flags[1]}:{pattern[flags.end():]})"
+            branches.append(f"(?P<_r{i}>{pattern})")
+
+        try:
+            return re.compile("|".join(branches))
+        except re.error as exc:
+            raise ValueError(f"Invalid poplog_rules: {exc}") from None
+
+    def match(self, line: str) -> tuple[PoplogRule, int, str] | None:
+        """Match a line against the rules
+
+        Args:
+            line: The line to match
+
+        Returns:
+            A tuple of the rule, the level number and the message if matched and
+            the message should be logged, otherwise None (not matched, dropped
+            by the rule or below the level threshold)
+        """
+        match = self.regex.match(line)
+        if not match:
+            return None
+
+        if len(self.rules) == 1:
+            index, prefix = 0, ""
+        else:
+            branch = match.lastgroup
+            index, prefix = int(branch[2:]), f"{branch}_"
+        rule = self.rules[index]
+        if rule.drop:
+            return None
+
+        default_levelno = self.levelnos.get(rule.level, logging.INFO)
+        if rule.force_level:
+            levelno = default_levelno
+        else:
+            level = match.group(f"{prefix}level") if rule.has_level else None
+            levelno = (
+                self.levelnos.get(level.lower(), default_levelno)
+                if level
+                else default_levelno
+            )
+
+        if levelno < self.thresholds[index]:
+            return None
+
+        msg = match.group(f"{prefix}message") if rule.has_message else None
+        if msg is None:
+            msg = match.group(prefix[:-1] or 0)
+
+        return rule, levelno, msg.rstrip()
+
+
+class CloudObjectStore(ABC):
+    """Access the objects of a cloud storage directly with the raw async client
+    of panpath, for the operations that panpath doesn't provide
+
+    The async client of the path (and so its connections) is reused, and the
+    stores are cached by bucket, so that a long-lived client is used for all the
+    requests to a bucket. Subclasses are registered by the scheme of the paths
+    (`gs`, `s3`, etc).
+
+    Attributes:
+        path (CloudPath): A path in the storage to get the client from
+    """
+
+    __slots__ = ("path",)
+
+    scheme: str = ""
+    _registry: dict[str, type[CloudObjectStore]] = {}
+    _stores: dict[str, CloudObjectStore] = {}
+
+    def __init_subclass__(cls, **kwargs: Any) -> None:
+        super().__init_subclass__(**kwargs)
+        if cls.scheme:
+            CloudObjectStore._registry[cls.scheme] = cls
+
+    def __init__(self, path: CloudPath) -> None:
+        self.path = path
+
+    @property
+    def client(self) -> Any:
+        """The async client of panpath, created on first access"""
+        return self.path.async_client
+
+    @classmethod
+    def for_path(cls, path: Any) -> CloudObjectStore | None:
+        """Get the store for the path, None if the storage is not supported"""
+        if not isinstance(path, CloudPath):
+            return None
+
+        scheme, rest = str(path).split("://", 1)
+        bucket = f"{scheme}://{rest.split('/', 1)[0]}"
+        if bucket not in cls._stores:
+            store_class = cls._registry.get(scheme)
+            if store_class is None:
+                return None
+            cls._stores[bucket] = store_class(path)
+
+        return cls._stores[bucket]
+
+    @abstractmethod
+    async def list_sizes(
+        self,
+        prefix: str,
+        names: Sequence[str],
+    ) -> dict[str, int]:
+        """List the objects with given basenames under the prefix
+
+        Args:
+            prefix: The prefix (directory) to list the objects under, recursively
+            names: The basenames of the objects to include
+
+        Returns:
+            The sizes of the objects, keyed by the full paths of the objects
+        """
+
+    @abstractmethod
+    async def read_tail(self, path: str, nbytes: int) -> bytes:
+        """Read the last bytes of an object with a suffix ranged request
+
+        Args:
+            path: The full path of the object
+            nbytes: The number of bytes to read from the end
+
+        Returns:
+            The bytes read, the whole object if it is smaller than nbytes
+
+        Raises:
+            FileNotFoundError: If the object does not exist
+        """
+
+    @abstractmethod
+    async def read_range(self, path: str, start: int, end: int) -> bytes:
+        """Read a range of bytes of an object with a ranged request
+
+        Args:
+            path: The full path of the object
+            start: The start offset (inclusive)
+            end: The end offset (exclusive)
+
+        Returns:
+            The bytes read, empty if start is beyond the end of the object
+
+        Raises:
+            FileNotFoundError: If the object does not exist
+        """
+
+
+class GSObjectStore(CloudObjectStore):
+    """Objects in Google Cloud Storage, via gcloud-aio-storage"""
+
+    __slots__ = ()
+
+    scheme = "gs"
+
+    async def list_sizes(
+        self,
+        prefix: str,
+        names: Sequence[str],
+    ) -> dict[str, int]:
+        storage = await self.client._get_client()
+        bucket, key = self.client._parse_path(prefix)
+        params = {
+            "prefix": f"{key.rstrip('/')}/",
+            "matchGlob": "**/{%s}" % ",".join(names),
+            "fields": "items(name,size),nextPageToken",
+        }
+        sizes = {}
+        while True:
+            response = await storage.list_objects(bucket, params=params)
+            for item in response.get("items", []):
+                sizes[f"gs://{bucket}/{item['name']}"] = int(item["size"])
+            if not response.get("nextPageToken"):
+                return sizes
+            params["pageToken"] = response["nextPageToken"]
+
+    async def read_range(self, path: str, start: int, end: int) -> bytes:
+        return await self._download(path, f"bytes={start}-{end - 1}")
+
+    async def read_tail(self, path: str, nbytes: int) -> bytes:
+        return await self._download(path, f"bytes=-{nbytes}")
+
+    async def _download(self, path: str, byte_range: str) -> bytes:
+        storage = await self.client._get_client()
+        bucket, key = self.client._parse_path(path)
+        try:
+            return await storage.download(bucket, key, headers={"Range": byte_range})
+        except Exception as e:
+            status = getattr(e, "status", None)
+            if status == 404:
+                raise FileNotFoundError(path) from e
+            if status == 416:  # range not satisfiable
+                return b""
+            raise
+
+
+class S3ObjectStore(CloudObjectStore):
+    """Objects in Amazon S3, via aioboto3"""
+
+    __slots__ = ()
+
+    scheme = "s3"
+
+    async def list_sizes(
+        self,
+        prefix: str,
+        names: Sequence[str],
+    ) -> dict[str, int]:
+        client = await self.client._get_client()
+        bucket, key = self.client._parse_path(prefix)
+        paginator = client.get_paginator("list_objects_v2")
+        sizes = {}
+        async for page in paginator.paginate(
+            Bucket=bucket,
+            Prefix=f"{key.rstrip('/')}/",
+        ):
+            for obj in page.get("Contents", []):
+                if obj["Key"].rsplit("/", 1)[-1] in names:
+                    sizes[f"s3://{bucket}/{obj['Key']}"] = obj["Size"]
+        return sizes
+
+    async def read_range(self, path: str, start: int, end: int) -> bytes:
+        return await self._get_object(path, f"bytes={start}-{end - 1}")
+
+    async def read_tail(self, path: str, nbytes: int) -> bytes:
+        return await self._get_object(path, f"bytes=-{nbytes}")
+
+    async def _get_object(self, path: str, byte_range: str) -> bytes:
+        client = await self.client._get_client()
+        bucket, key = self.client._parse_path(path)
+        try:
+            response = await client.get_object(Bucket=bucket, Key=key, Range=byte_range)
+        except Exception as e:
+            code = getattr(e, "response", {}).get("Error", {}).get("Code")
+            if code in ("NoSuchKey", "404"):
+                raise FileNotFoundError(path) from e
+            if code == "InvalidRange":
+                return b""
+            raise
+
+        async with response["Body"] as stream:
+            return await stream.read()
+
+
+async def read_tail(
+    path: str | Path | CloudPath,
+    nlines: int,
+    max_bytes: int,
+    block_size: int = 4096,
+) -> list[str]:
+    """Read the last lines of a file, with the cost bounded by max_bytes no matter
+    how large the file is
+
+    Local files are read backwards from the end in blocks, until enough lines
+    are read. Cloud files are read with a single suffix ranged request if the
+    storage is supported, otherwise the whole file is read.
+
+    Args:
+        path: The path of the file
+        nlines: The max number of lines to return
+        max_bytes: The max number of bytes to read from the end
+        block_size: The size of the blocks to read local files backwards
+
+    Returns:
+        The last lines of the file, empty if the file does not exist
+    """
+    path = path if isinstance(path, PanPath) else PanPath(path)
+    content: bytes
+    # whether the first line read starts in the middle of a line
+    truncated = False
+    if isinstance(path, CloudPath):
+        store = CloudObjectStore.for_path(path)
+        try:
+            # one more byte to tell if the first line is truncated
+            if store is not None:
+                content = await store.read_tail(str(path), max_bytes + 1)
+            else:
+                content = (await path.a_read_bytes())[-max_bytes - 1 :]
+        except FileNotFoundError:
+            return []
+
+        if len(content) > max_bytes:
+            truncated = content[:1] != b"\n"
+            content = content[1:]
+    else:
+        try:
+            f = await path.a_open("rb").__aenter__()
+        except FileNotFoundError:
+            return []
+
+        try:
+            pos = await f.seek(0, os.SEEK_END)
+            end = pos
+            content = b""
+            while pos > 0 and end - pos < max_bytes:
+                size = min(block_size, pos, max_bytes - (end - pos))
+                pos -= size
+                await f.seek(pos)
+                block: bytes = await f.read(size)  # type: ignore[assignment]
+                content = block + content
+                # one more newline for the possibly truncated first line
+                if content.count(b"\n") > nlines:
+                    break
+
+            if pos > 0:
+                await f.seek(pos - 1)
+                truncated = await f.read(1) != b"\n"
+        finally:
+            await f.close()
+
+    lines = content.splitlines()
+    if truncated and len(lines) > 1:
+        lines.pop(0)
+    return [line.decode(errors="replace") for line in lines[-nlines:]]
+
+
+async def find_tail_offset(
+    read_at: Callable[[int, int], Awaitable[bytes]],
+    size: int,
+    nlines: int,
+    max_bytes: int = 1024 * 1024,
+    block_size: int = 65536,
+) -> int:
+    """Find the offset where the last lines of a file start, by reading blocks
+    backwards from the end
+
+    Args:
+        read_at: An async function to read the bytes in [start, end) of the file
+        size: The size of the file
+        nlines: The number of the last lines, 0 for the end of the file
+        max_bytes: The max number of bytes to scan from the end. If reached, the
+            offset of the first complete line in the scanned bytes is returned.
+        block_size: The size of the blocks to read
+
+    Returns:
+        The offset where the last lines start
+    """
+    if nlines <= 0:
+        return size
+
+    pos = size
+    count = 0
+    earliest = -1
+    while pos > 0 and size - pos < max_bytes:
+        start = max(0, pos - block_size, size - max_bytes)
+        block = await read_at(start, pos)
+        idx = len(block)
+        # the trailing newline doesn't start a new line
+        if pos == size and block.endswith(b"\n"):
+            idx -= 1
+
+        while True:
+            idx = block.rfind(b"\n", 0, idx)
+            if idx < 0:
+                break
+            count += 1
+            earliest = start + idx
+            if count == nlines:
+                return earliest + 1
+
+        pos = start
+
+    if pos == 0 or earliest < 0:
+        return pos
+    return earliest + 1
+
+
+class CloudJobLister:
+    """List the stdout/stderr objects of all jobs of a proc once per poll cycle
+
+    Instead of checking the existence and reading each object of the jobs at
+    each poll, the job directory of the proc is listed once per poll cycle, and
+    only the objects grown since the last read are read.
+
+    The poll cycle is identified by the cycle number of the populator scheduler
+    (see `PopulatorScheduler`), which is the same for all jobs visited in a
+    cycle. The final sweep when a job is done (a negative cycle) doesn't use
+    the lister, but reads the object until the end instead, so that finishing
+    jobs don't list the whole job directory each.
+
+    A listing takes a request per page of the objects in the job directory
+    (all of them with S3, which can't filter the names on the server), while
+    checking an object takes a couple of requests. So the lister is only
+    active when at least `min_jobs` jobs of the proc are tracked, and the
+    objects are checked each otherwise.
+
+    Attributes:
+        store (CloudObjectStore): The store to list the objects
+        prefix (str): The job directory of the proc
+        names (tuple[str, ...]): The basenames of the objects to list
+        min_jobs (int): The min number of the tracked jobs to list
+        jobs (set[int]): The indexes of the tracked jobs
+        cycle (int): The poll cycle of the last listing
+        sizes (dict[str, int] | None): The sizes of the objects of the last listing
+    """
+
+    __slots__ = (
+        "store",
+        "prefix",
+        "names",
+        "min_jobs",
+        "jobs",
+        "cycle",
+        "sizes",
+        "_lock",
+    )
+
+    def __init__(
+        self,
+        store: CloudObjectStore,
+        prefix: str | CloudPath,
+        names: Sequence[str] = ("job.stdout", "job.stderr"),
+        min_jobs: int = 0,
+    ) -> None:
+        self.store = store
+        self.prefix = str(prefix)
+        self.names = tuple(names)
+        self.min_jobs = min_jobs
+        self.jobs: set[int] = set()
+        self.cycle = -1
+        self.sizes: dict[str, int] | None = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def active(self) -> bool:
+        """Whether enough jobs are tracked to list the objects"""
+        return len(self.jobs) >= self.min_jobs
+
+    async def size(self, path: str | os.PathLike, cycle: int) -> int | None:
+        """Get the size of the object, None if it doesn't exist
+
+        Args:
+            path: The path of the object
+            cycle: The poll cycle
+        """
+        async with self._lock:
+            if self.sizes is None or cycle != self.cycle:
+                self.sizes = await self.store.list_sizes(self.prefix, self.names)
+                self.cycle = cycle
+
+        return self.sizes.get(str(path))
+
+
+class StreamDecompressor:
+    """Incrementally decompress a log file that is read in chunks
+
+    The decompression state is kept across the chunks, so that the file doesn't
+    need to be decompressed from the beginning at each read. Concatenated
+    gzip members/zstd frames (e.g. from appending) are supported.
+
+    Attributes:
+        format (str | None):
+            The compression format, `gzip`, `zstd` or `none`. None to detect it
+            from the magic bytes of the first chunk.
+    """
+
+    __slots__ = ("format", "_obj", "_pending")
+
+    MAGICS = {b"\x1f\x8b": "gzip", b"\x28\xb5\x2f\xfd": "zstd"}
+    FORMATS = ("auto", "none", "gzip", "zstd")
+
+    def __init__(self, format: str | None = None) -> None:
+        if format == "auto":
+            format = None
+        if format is not None and format not in self.FORMATS:
+            raise ValueError(
+                f"Invalid poplog_compression: {format!r}, "
+                f"expected one of {self.FORMATS}"
+            )
+        self.format = format
+        self._obj: Any = None
+        self._pending = b""
+
+    @classmethod
+    def detect(cls, head: bytes) -> str | None:
+        """Detect the format from the first bytes
+
+        Returns:
+            The format, or None if more bytes are needed to tell
+        """
+        for magic, format in cls.MAGICS.items():
+            if head.startswith(magic):
+                return format
+            if magic.startswith(head):
+                return None
+        return "none"
+
+    def _new_obj(self) -> Any:
+        if self.format == "gzip":
+            # 16: expect the gzip header and trailer
+            return zlib.decompressobj(zlib.MAX_WBITS | 16)
+
+        try:
+            import zstandard
+        except ImportError:
+            logger.warning(
+                "zstandard is required to populate zstd-compressed logs, "
+                "populating them as plain text."
+            )
+            self.format = "none"
+            return None
+
+        return zstandard.ZstdDecompressor().decompressobj()
+
+    def decompress(self, data: bytes, final: bool = False) -> bytes:
+        """Decompress a chunk
+
+        Args:
+            data: The chunk read from the file
+            final: Whether this is the last chunk. If the format can't be
+                detected until the last chunk, the data is treated as plain.
+
+        Returns:
+            The decompressed bytes
+        """
+        if self.format is None:
+            data = self._pending + data
+            self.format = self.detect(data[:4])
+            if self.format is None:
+                if not final:
+                    self._pending = data
+                    return b""
+                self.format = "none"
+            self._pending = b""
+            if self.format != "none":
+                self._obj = self._new_obj()
+
+        if self.format == "none":
+            return data
+
+        out = []
+        while data:
+            out.append(self._obj.decompress(data))
+            if not getattr(self._obj, "eof", False):
+                break
+            # start of the next gzip member/zstd frame
+            data = self._obj.unused_data
+            self._obj = self._new_obj()
+        return b"".join(out)
+
+
+class OutputRing:
+    """A fixed-size ring buffer of the most recent output of a job
+
+    The memory is allocated once (a bytearray of `size` bytes) and the oldest
+    bytes are overwritten by the new ones, so the memory stays constant no
+    matter how much output is written.
+
+    Attributes:
+        buffer (bytearray): The buffer
+        size (int): The max number of bytes to keep
+        nlines (int): The max number of lines to return by `lines()`, `0` for
+            all the lines in the buffer
+        pos (int): The position in the buffer to write next
+        full (bool): Whether the buffer has wrapped around
+        cut (bool): Whether the oldest line in the buffer is cut, i.e. the last
+            byte overwritten is not a newline
+    """
+
+    __slots__ = ("buffer", "size", "nlines", "pos", "full", "cut")
+
+    def __init__(self, size: int = 65536, nlines: int = 0) -> None:
+        if size <= 0:
+            raise ValueError(f"Invalid size of the ring buffer: {size!r}")
+        self.buffer = bytearray(size)
+        self.size = size
+        self.nlines = nlines
+        self.pos = 0
+        self.full = False
+        self.cut = False
+
+    def write(self, data: bytes) -> None:
+        """Write the data, overwriting the oldest bytes if full"""
+        used = self.size if self.full else self.pos
+        # the number of the oldest bytes (in the buffer and then the data) to drop
+        dropped = used + len(data) - self.size
+        if dropped > 0:
+            if dropped <= used:
+                oldest = self.pos if self.full else 0
+                last = self.buffer[(oldest + dropped - 1) % self.size]
+            else:
+                last = data[dropped - used - 1]
+            self.cut = last != 0x0A  # b"\n"
+
+        if len(data) >= self.size:
+            self.buffer[:] = data[-self.size:]
+            self.pos = 0
+            self.full = True
+            return
+
+        end = self.pos + len(data)
+        if end < self.size:
+            self.buffer[self.pos:end] = data
+            self.pos = end
+            return
+
+        head = self.size - self.pos
+        self.buffer[self.pos:] = data[:head]
+        self.buffer[: end - self.size] = data[head:]
+        self.pos = end - self.size
+        self.full = True
+
+    def getvalue(self) -> bytes:
+        """Get the bytes in the buffer, from the oldest to the newest"""
+        if not self.full:
+            return bytes(self.buffer[: self.pos])
+        return bytes(self.buffer[self.pos:] + self.buffer[: self.pos])
+
+    def lines(self) -> list[str]:
+        """Get the last lines in the buffer
+
+        The first line is dropped if it is cut by the wrap-around.
+        """
+        lines = self.getvalue().decode(errors="replace").splitlines()
+        if self.cut and lines:
+            lines.pop(0)
+        return lines[-self.nlines:] if self.nlines > 0 else lines
+
+
 class LogsPopulator:
     """
     A class to handle the population of logs from a given file-like object.
@@ -68,6 +898,31 @@ class LogsPopulator:
             The maximum number of log lines to read. A value of 0 means no limit.
         hit_message (str):
             A message to log when the maximum number of log lines has been reached.
+        lister (CloudJobLister | None):
+            The lister to get the sizes of the cloud log files in batch. If not
+            set, the existence of the cloud log file is checked at each read.
+        store (CloudObjectStore | None):
+            The store to read the cloud log file with ranged requests from the
+            last read position. If not set, the file is opened at each read.
+        chunk_size (int):
+            The max number of bytes to read from the cloud log file with `store`
+            at each poll. The final sweep (a negative cycle) reads until the end.
+        track_offsets (bool):
+            Whether to track the byte offsets of the lines in the log file. If
+            True, `offsets` holds the offsets of the lines of the last populate.
+        offsets (list[int]):
+            The byte offsets of the lines returned by the last populate, if
+            `track_offsets` is True.
+        start (str | int):
+            Where to start populating when the log file is first seen:
+            `beginning`, `end`, or the number of the last lines. The offset of
+            the last lines is found by reading blocks backwards from the end.
+            Compressed log files are always populated from the beginning.
+        decompressor (StreamDecompressor | None):
+            The decompressor for compressed log files, None for plain files.
+        ring (OutputRing | None):
+            The ring buffer to keep the most recent (decompressed) output read,
+            for inspection (see `PipenPoplogPlugin.dump_output()`).
         _max_hit (bool):
             A flag indicating whether the maximum number of log lines has been reached.
 
@@ -77,9 +932,9 @@ class LogsPopulator:
         max_hit -> bool:
             Returns True if the maximum number of log lines has been reached,
             otherwise False.
-        populate() -> list[str]:
+        populate(cycle: int = -1) -> list[str]:
             Reads the log file, processes its content, and returns a list of
-            complete lines.
+            complete lines. `cycle` is the poll cycle for the lister.
             Any incomplete line at the end of the file is stored as residue for the
             next read.
     """
@@ -91,8 +946,18 @@ class LogsPopulator:
         "counter",
         "max",
         "hit_message",
+        "lister",
+        "store",
+        "chunk_size",
+        "start",
+        "track_offsets",
+        "offsets",
+        "decompressor",
+        "ring",
         "_max_hit",
         "_pos",
+        "_out_pos",
+        "_started",
     )
 
     def __init__(
@@ -100,15 +965,47 @@ class LogsPopulator:
         logfile: str | Path | CloudPath | None = None,
         max: int = 0,
         hit_message: str = "max messages reached",
+        lister: CloudJobLister | None = None,
+        store: CloudObjectStore | None = None,
+        chunk_size: int = 8 * 1024 * 1024,
+        start: str | int = "beginning",
+        track_offsets: bool = False,
+        compression: str | None = None,
+        ring_bytes: int = 0,
+        ring_lines: int = 0,
     ) -> None:
+        if isinstance(start, str) and start.isdigit():
+            start = int(start)
+        if start not in ("beginning", "end") and (
+            not isinstance(start, int) or start < 0
+        ):
+            raise ValueError(
+                f"Invalid poplog_start: {start!r}, expected 'beginning', 'end' "
+                "or the number of the last lines"
+            )
         self.logfile = PanPath(logfile) if isinstance(logfile, str) else logfile
         self.handler = None
         self.residue = b""
         self.counter = 0
         self.max = max
         self.hit_message = hit_message
+        self.lister = lister
+        self.store = store
+        self.chunk_size = chunk_size
+        self.start = start
+        self.track_offsets = track_offsets
+        self.offsets: list[int] = []
+        self.decompressor = (
+            None
+            if compression in (None, "none")
+            else StreamDecompressor(compression)
+        )
+        self.ring = OutputRing(ring_bytes, ring_lines) if ring_bytes > 0 else None
         self._max_hit = False
         self._pos = 0
+        # the position in the (decompressed) content
+        self._out_pos = 0
+        self._started = start == "beginning"
 
     def increment_counter(self, n: int = 1) -> None:
         self.counter += n
@@ -117,7 +1014,106 @@ class LogsPopulator:
     def max_hit(self) -> bool:
         return self._max_hit
 
-    async def populate(self) -> list[str]:
+    async def _listed_size(self, cycle: int) -> tuple[bool, int | None]:
+        """Get the size of the log file from the lister
+
+        Returns:
+            Whether the size is listed, and the size (None if not existing)
+        """
+        # The final sweep reads until the end without listing
+        if self.lister is None or cycle < 0 or not self.lister.active:
+            return False, None
+
+        try:
+            return True, await self.lister.size(self.logfile, cycle)
+        except Exception:
+            # listing is not supported or not permitted,
+            # fall back to checking the object itself
+            self.lister = None
+            return False, None
+
+    async def _grown(self, cycle: int) -> bool:
+        """Check if the log file exists and has grown since the last read"""
+        listed, size = await self._listed_size(cycle)
+        if listed:
+            return size is not None and size > self._pos
+
+        return await self.logfile.a_exists()
+
+    async def _seek_start(self) -> None:
+        """Move the read position to where to start populating"""
+        nlines = 0 if self.start == "end" else int(self.start)
+
+        if not isinstance(self.logfile, CloudPath):
+            self.handler = await self.logfile.a_open("rb").__aenter__()
+            handler = self.handler
+
+            async def read_at(start: int, end: int) -> bytes:
+                await handler.seek(start)
+                return await handler.read(end - start)
+
+            size = await handler.seek(0, os.SEEK_END)
+
+        elif self.store is not None:
+            store, path = self.store, str(self.logfile)
+            size = (await self.logfile.a_stat()).st_size
+
+            async def read_at(start: int, end: int) -> bytes:
+                return await store.read_range(path, start, end)
+
+        else:
+            content = await self.logfile.a_read_bytes()
+            size = len(content)
+
+            async def read_at(start: int, end: int) -> bytes:
+                return content[start:end]
+
+        if (
+            self.decompressor is None
+            or self.decompressor.format == "none"
+            or (
+                self.decompressor.format is None
+                and StreamDecompressor.detect(await read_at(0, 4)) == "none"
+            )
+        ):
+            self._pos = self._out_pos = await find_tail_offset(read_at, size, nlines)
+
+        if self.handler is not None:
+            await self.handler.seek(self._pos)
+
+    async def _read_ranges(self, cycle: int) -> bytes | None:
+        """Read the new content of the cloud log file with ranged requests
+
+        Returns:
+            The new content, None if the file doesn't exist or hasn't grown
+        """
+        listed, size = await self._listed_size(cycle)
+        if listed and (size is None or size <= self._pos):
+            return None
+
+        chunks = []
+        while True:
+            start = self._pos
+            end = start + self.chunk_size
+            if size is not None:
+                end = min(end, size)
+            try:
+                chunk = await self.store.read_range(str(self.logfile), start, end)
+            except FileNotFoundError:
+                break
+
+            chunks.append(chunk)
+            self._pos += len(chunk)
+            if (
+                cycle >= 0
+                or len(chunk) < end - start
+                or (size is not None and self._pos >= size)
+            ):
+                break
+
+        return b"".join(chunks) if chunks else None
+
+    async def populate(self, cycle: int = -1) -> list[str]:
         if self._max_hit:
             return []
 
@@ -125,20 +1121,47 @@ class LogsPopulator:
             self._max_hit = True
             return [self.hit_message]
 
-        if not await self.logfile.a_exists():
+        if not self._started:
+            if not await self.logfile.a_exists():
+                return []
+            await self._seek_start()
+            self._started = True
+
+        new_content: bytes
+        if self.store is not None:
+            # None if nothing new, but the decompressor is finalized anyway
+            # by the final sweep
+            new_content = await self._read_ranges(cycle)
+            if new_content is None:
+                if self.decompressor is None or cycle >= 0:
+                    return []
+                new_content = b""
+        elif not await self._grown(cycle):
             return []
-
-        if not self.handler and not isinstance(self.logfile, CloudPath):
-            self.handler = await self.logfile.a_open("rb").__aenter__()
-
-        if not isinstance(self.logfile, CloudPath):
-            content: bytes = self.residue + await self.handler.read()
+        elif not isinstance(self.logfile, CloudPath):
+            if not self.handler:
+                self.handler = await self.logfile.a_open("rb").__aenter__()
+            new_content = await self.handler.read()  # type: ignore
+            self._pos += len(new_content)
         else:
             async with self.logfile.a_open("rb") as f:
                 await f.seek(self._pos)
-                content: bytes = self.residue + await f.read()  # type: ignore
+                new_content = await f.read()  # type: ignore
                 self._pos = await f.tell()
 
+        if self.decompressor is not None:
+            new_content = self.decompressor.decompress(
+                new_content,
+                final=cycle < 0,
+            )
+        self._out_pos += len(new_content)
+        if self.ring is not None:
+            self.ring.write(new_content)
+        content: bytes = self.residue + new_content
+
+        if self.track_offsets:
+            return self._split_with_offsets(content)
+
         has_residue = content.endswith(b"\n")
         lines = content.splitlines()
 
@@ -149,12 +1172,932 @@ class LogsPopulator:
 
         return [line.decode() for line in lines]
 
+    def _split_with_offsets(self, content: bytes) -> list[str]:
+        """Split the content into lines and record the offsets of the lines"""
+        offset = self._out_pos - len(content)
+        lines = content.splitlines(keepends=True)
+        if lines and not content.endswith(b"\n"):
+            self.residue = lines.pop(-1)
+        else:
+            self.residue = b""
+
+        self.offsets = []
+        out = []
+        for line in lines:
+            self.offsets.append(offset)
+            offset += len(line)
+            out.append(line.rstrip(b"\r\n").decode())
+        return out
+
+    @property
+    def residue_offset(self) -> int:
+        """The byte offset of the residue in the (decompressed) log file"""
+        return self._out_pos - len(self.residue)
+
     async def destroy(self) -> None:
         if self.handler and not isinstance(self.logfile, CloudPath):
             await self.handler.close()
             self.handler = None
 
 
+def _build_queue_classes() -> dict[str, type]:
+    """Build the classes to emit the records via a queue, so that
+    `logging.handlers` is only imported when `poplog_queue` is enabled"""
+    from logging.handlers import QueueHandler, QueueListener
+    from queue import Empty, Full, Queue
+
+    class PoplogQueueHandler(QueueHandler):
+        """A queue handler with a bounded queue and an overflow policy
+
+        Attributes:
+            overflow (str):
+                What to do when the queue is full, `drop` to drop the new record, or
+                `drop_oldest` to drop the oldest record in the queue to make room.
+            dropped (int):
+                The number of records dropped because the queue was full.
+        """
+
+        def __init__(self, queue: Queue, overflow: str = "drop") -> None:
+            if overflow not in ("drop", "drop_oldest"):
+                raise ValueError(
+                    f"Invalid poplog_queue_overflow: {overflow!r}, "
+                    "expected 'drop' or 'drop_oldest'"
+                )
+            super().__init__(queue)
+            self.overflow = overflow
+            self.dropped = 0
+
+        def enqueue(self, record: logging.LogRecord) -> None:
+            try:
+                self.queue.put_nowait(record)
+            except Full:
+                if self.overflow == "drop":
+                    self.dropped += 1
+                    return
+
+                with suppress(Empty):
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                with suppress(Full):
+                    self.queue.put_nowait(record)
+
+    class PoplogQueueListener(QueueListener):
+        """A queue listener that emits the records with the handlers of the loggers
+        they are from, in a background thread
+
+        The handlers of the attached loggers are replaced by the queue handler, and
+        restored when detached. A flush request (see `request_flush()`) goes
+        through the queue as well, so that the flushing handlers are flushed and
+        fsync'ed in the background thread after the records before it are emitted.
+
+        Attributes:
+            queue_handler (PoplogQueueHandler): The handler to put records in the queue
+            routes (dict[str, list[logging.Handler]]):
+                The original handlers of the attached loggers, by logger name
+            flushing_handlers (set[logging.Handler]):
+                The handlers to flush upon flush requests
+        """
+
+        FLUSH = logging.makeLogRecord({"msg": "poplog:flush"})
+
+        def __init__(
+            self,
+            maxsize: int,
+            overflow: str = "drop",
+            flushing_handlers: Iterable[logging.Handler] = (),
+        ) -> None:
+            queue: Queue = Queue(maxsize)
+            super().__init__(queue)
+            self.queue_handler = PoplogQueueHandler(queue, overflow)
+            self.routes: dict[str, list[logging.Handler]] = {}
+            self.flushing_handlers = set(flushing_handlers)
+
+        def attach(self, log: logging.Logger | logging.LoggerAdapter) -> None:
+            """Redirect the records of the logger to the queue"""
+            base = log.logger if isinstance(log, logging.LoggerAdapter) else log
+            if base.name in self.routes:
+                return
+
+            self.routes[base.name] = base.handlers[:]
+            base.handlers = [self.queue_handler]
+
+        def detach_all(self) -> None:
+            """Restore the handlers of all attached loggers"""
+            for name, handlers in self.routes.items():
+                logging.getLogger(name).handlers = handlers
+            self.routes.clear()
+
+        def enqueue_sentinel(self) -> None:
+            """Wait for room for the sentinel in the bounded queue, instead of
+            raising Full as the base class does with put_nowait()"""
+            self.queue.put(self._sentinel)
+
+        def request_flush(self) -> None:
+            """Request to flush the flushing handlers in the background thread"""
+            with suppress(Full):
+                self.queue.put_nowait(self.FLUSH)
+
+        def handle(self, record: logging.LogRecord) -> None:
+            if record is self.FLUSH:
+                _fsync_handlers(self.flushing_handlers)
+                return
+
+            for handler in self.routes.get(record.name, ()):
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+
+    return {
+        "PoplogQueueHandler": PoplogQueueHandler,
+        "PoplogQueueListener": PoplogQueueListener,
+    }
+
+
+class PoplogIndex:
+    """An on-disk SQLite index of the populated messages of a run
+
+    The messages are buffered and written in batches, one transaction at the end
+    of each cycle of the populator scheduler, in WAL mode so that the index can
+    be queried while the pipeline is running.
+
+    Attributes:
+        path (str): The path to the database file
+        conn (sqlite3.Connection): The connection to the database
+        pending (list[tuple]): The rows to be written
+    """
+
+    __slots__ = ("path", "conn", "pending")
+
+    FILENAME = "poplog.db"
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS messages (
+            proc TEXT NOT NULL,
+            job INTEGER NOT NULL,
+            level INTEGER NOT NULL,
+            time REAL NOT NULL,
+            source TEXT NOT NULL,
+            offset INTEGER,
+            message TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS messages_proc_job ON messages (proc, job);
+        CREATE INDEX IF NOT EXISTS messages_level ON messages (level);
+    """
+
+    def __init__(self, path: str | Path, reset: bool = False) -> None:
+        import sqlite3
+
+        self.path = str(path)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.conn:
+            self.conn.executescript(self.SCHEMA)
+            if reset:
+                self.conn.execute("DELETE FROM messages")
+        self.pending: list[tuple] = []
+
+    def add(
+        self,
+        proc: str,
+        job: int,
+        levelno: int,
+        source: str,
+        offset: int | None,
+        message: str,
+    ) -> None:
+        """Add a message to be written"""
+        self.pending.append((proc, job, levelno, time.time(), source, offset, message))
+
+    def commit(self) -> None:
+        """Write the pending messages in a transaction"""
+        if not self.pending:
+            return
+
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO messages VALUES (?, ?, ?, ?, ?, ?, ?)",
+                self.pending,
+            )
+        self.pending = []
+
+    def query(
+        self,
+        proc: str | None = None,
+        job: int | None = None,
+        level: int | str | None = None,
+        search: str | None = None,
+        limit: int | None = None,
+    ) -> list[tuple[str, int, int, float, str, int | None, str]]:
+        """Query the messages
+
+        Args:
+            proc: The name of the proc
+            job: The index of the job
+            level: The minimum level of the messages
+            search: The text that the messages contain
+            limit: The max number of messages to return
+
+        Returns:
+            The rows of (proc, job, level, time, source, offset, message),
+            ordered by time
+        """
+        self.commit()
+        where: list[str] = []
+        params: list[Any] = []
+        if proc is not None:
+            where.append("proc = ?")
+            params.append(proc)
+        if job is not None:
+            where.append("job = ?")
+            params.append(job)
+        if level is not None:
+            if isinstance(level, str):
+                level = logging._nameToLevel[level.upper()]
+            where.append("level >= ?")
+            params.append(level)
+        if search:
+            where.append("message LIKE ? ESCAPE '\\'")
+            escaped = re.sub(r"([%_\\])", r"\\\1", search)
+            params.append(f"%{escaped}%")
+
+        sql = "SELECT * FROM messages"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY time, rowid"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+
+        return self.conn.execute(sql, params).fetchall()
+
+    def close(self) -> None:
+        """Write the pending messages and close the connection"""
+        self.commit()
+        self.conn.close()
+
+
+def _build_cli_plugin() -> dict[str, type]:
+    """Build the CLI plugin, so that `pipen.cli` is only imported by the
+    `pipen` command, not by the pipelines"""
+    from pipen.cli import CLIPlugin
+
+    class PoplogCLIPlugin(CLIPlugin):
+        """Query the messages populated by pipen-poplog of a run
+
+        The messages are indexed when `plugin_opts.poplog_index` is enabled.
+        """
+
+        name = "poplog"
+
+        def __init__(
+            self,
+            parser: ArgumentParser,
+            subparser: ArgumentParser,
+        ) -> None:
+            super().__init__(parser, subparser)
+            subparser.add_argument(
+                "index",
+                help=(
+                    "The index file, or the pipeline workdir "
+                    f"(e.g. `.pipen/<pipeline>`) containing `{PoplogIndex.FILENAME}`"
+                ),
+            )
+            subparser.add_argument("-p", "--proc", help="The name of the proc")
+            subparser.add_argument("-j", "--job", type=int, help="The index of the job")
+            subparser.add_argument(
+                "-l",
+                "--level",
+                help="The minimum level of the messages (e.g. warning)",
+            )
+            subparser.add_argument(
+                "-s",
+                "--search",
+                help="Only show messages containing the text",
+            )
+            subparser.add_argument(
+                "-n",
+                "--limit",
+                type=int,
+                help="The max number of messages to show",
+            )
+
+        def exec_command(self, args: Namespace) -> None:
+            """Run the command"""
+            path = Path(args.index)
+            if path.is_dir():
+                path = path / PoplogIndex.FILENAME
+            if not path.is_file():
+                raise FileNotFoundError(f"Poplog index not found: {path}")
+
+            index = PoplogIndex(path)
+            try:
+                rows = index.query(
+                    proc=args.proc,
+                    job=args.job,
+                    level=args.level,
+                    search=args.search,
+                    limit=args.limit,
+                )
+            finally:
+                index.close()
+
+            for proc, job, levelno, tm, source, offset, message in rows:
+                print(
+                    time.strftime("%m-%d %H:%M:%S", time.localtime(tm)),
+                    logging.getLevelName(levelno)[:1],
+                    f"{proc}[{job}]",
+                    f"({source}@{offset})" if offset is not None else f"({source})",
+                    message,
+                )
+
+    return {"PoplogCLIPlugin": PoplogCLIPlugin}
+
+
+# The builders of the classes that need the modules not needed by most runs,
+# the classes are built on first access (see `_lazy()` and `__getattr__()`)
+_LAZY_BUILDERS: dict[str, Callable[[], dict[str, type]]] = {
+    "PoplogQueueHandler": _build_queue_classes,
+    "PoplogQueueListener": _build_queue_classes,
+    "PoplogCLIPlugin": _build_cli_plugin,
+}
+
+
+def _lazy(name: str) -> Any:
+    """Get a lazily built class, build it if not yet"""
+    if name not in globals():
+        for cls in (classes := _LAZY_BUILDERS[name]()).values():
+            cls.__qualname__ = cls.__name__
+        globals().update(classes)
+    return globals()[name]
+
+
+def __getattr__(name: str) -> Any:
+    """Build the lazy classes on first access from outside (PEP 562)"""
+    if name not in _LAZY_BUILDERS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return _lazy(name)
+
+
+class FlushPolicy:
+    """Decide when to flush the handlers based on the levels and the volume of
+    the records emitted since the last flush
+
+    - Nothing is flushed if no records are emitted since the last flush.
+    - A record with level not less than `urgent_level` makes the flush due
+      immediately. Multiple urgent records emitted in the same poll lead to a
+      single flush, since the flush is checked after each poll.
+    - Otherwise, the flush is due when `max_records` records or `max_bytes`
+      bytes of messages are pending, or the interval has elapsed since the
+      last flush.
+
+    Attributes:
+        urgent_level (int): The level of records to be flushed immediately
+        max_records (int): The max number of pending records (0 for no limit)
+        max_bytes (int): The max bytes of pending messages (0 for no limit)
+        pending_records (int): The number of records since the last flush
+        pending_bytes (int): The bytes of messages since the last flush
+        urgent (bool): Whether an urgent record is pending
+        last_flush_time (float): The time of the last flush
+    """
+
+    __slots__ = (
+        "urgent_level",
+        "max_records",
+        "max_bytes",
+        "pending_records",
+        "pending_bytes",
+        "urgent",
+        "last_flush_time",
+    )
+
+    def __init__(
+        self,
+        urgent_level: int | str = logging.ERROR,
+        max_records: int = 0,
+        max_bytes: int = 0,
+    ) -> None:
+        if isinstance(urgent_level, str):
+            urgent_level = logging._nameToLevel[urgent_level.upper()]
+        self.urgent_level = urgent_level
+        self.max_records = max_records
+        self.max_bytes = max_bytes
+        self.pending_records = 0
+        self.pending_bytes = 0
+        self.urgent = False
+        self.last_flush_time = 0.0
+
+    def record(self, levelno: int, nbytes: int) -> None:
+        """Account a record emitted"""
+        self.pending_records += 1
+        self.pending_bytes += nbytes
+        if levelno >= self.urgent_level:
+            self.urgent = True
+
+    def due(self, interval: float) -> bool:
+        """Check if the flush is due
+
+        Args:
+            interval: The interval to flush the non-urgent records
+        """
+        if not self.pending_records:
+            return False
+
+        return (
+            self.urgent
+            or 0 < self.max_records <= self.pending_records
+            or 0 < self.max_bytes <= self.pending_bytes
+            or time.time() - self.last_flush_time >= interval
+        )
+
+    def flushed(self) -> None:
+        """Reset the pending records after a flush"""
+        self.pending_records = 0
+        self.pending_bytes = 0
+        self.urgent = False
+        self.last_flush_time = time.time()
+
+
+class MessageAggregator:
+    """Group the messages of the jobs of a proc by their templates
+
+    The template of a message is the message with the paths and the numbers
+    masked, so that the near-identical messages from different jobs (e.g.
+    `Loaded reference /path/to/ref1.fa in 12.3s`) are counted together. Only
+    the first `live` messages of each template are to be logged, and the rest
+    are only counted, so that the log grows with the number of distinct
+    messages instead of the number of jobs.
+
+    Attributes:
+        live (int): The number of the first messages of each template to log
+        max_templates (int): The max number of the templates to keep, the
+            messages with new templates after that are counted as `<other>`
+        counts (dict[tuple[int, str], int]): The counts of the messages by
+            the level number and the template
+    """
+
+    __slots__ = ("live", "max_templates", "counts")
+
+    OTHER = "<other>"
+    MASK = re.compile(
+        r"(?P<path>[^\s'\"=]*/[^\s'\",;]*)"
+        r"|(?P<number>(?<![\w.])\d+(?:\.\d+)?(?:[eE][-+]?\d+)?)"
+    )
+
+    def __init__(self, live: int = 3, max_templates: int = 1000) -> None:
+        self.live = live
+        self.max_templates = max_templates
+        self.counts: dict[tuple[int, str], int] = {}
+
+    @classmethod
+    def template(cls, msg: str) -> str:
+        """Get the template of a message"""
+        return cls.MASK.sub(lambda m: f"<{m.lastgroup}>", msg)
+
+    def add(self, levelno: int, msg: str) -> bool:
+        """Count a message
+
+        Returns:
+            Whether the message should be logged
+        """
+        key = (levelno, self.template(msg))
+        count = self.counts.get(key)
+        if count is None:
+            if len(self.counts) >= self.max_templates:
+                key = (levelno, self.OTHER)
+            count = self.counts.get(key, 0)
+
+        self.counts[key] = count + 1
+        return count < self.live
+
+    def summary(self) -> str | None:
+        """Get the summary table of the counts by level and template
+
+        Returns:
+            The table, or None if no messages are hidden from the log
+        """
+        if all(count <= self.live for count in self.counts.values()):
+            return None
+
+        rows = sorted(self.counts.items(), key=lambda item: (-item[0][0], -item[1]))
+        width = max(len("COUNT"), *(len(str(count)) for _, count in rows))
+        return "\n".join(
+            [
+                f"Message summary ({sum(self.counts.values())} message(s), "
+                f"{len(self.counts)} template(s)):",
+                f"  {'LEVEL':<8} {'COUNT':>{width}}  TEMPLATE",
+            ]
+            + [
+                f"  {logging.getLevelName(levelno):<8} {count:>{width}}  {template}"
+                for (levelno, template), count in rows
+            ]
+        )
+
+
+class JobSampler:
+    """Choose the jobs of a proc to populate by a deterministic hash
+
+    Each job gets a key in [0, 1) from the hash of the proc name and the job
+    index, and the jobs with keys not greater than the rate are sampled. So the
+    same jobs are sampled across runs, and lowering the rate only drops jobs
+    from the sample.
+
+    The rate is adapted to the measured cost of populating the jobs of the proc
+    (the time spent in a cycle of the populator scheduler): halved for the jobs
+    to start when the cost exceeds the budget, and raised back (up to the
+    sample) when it is below half of the budget.
+
+    Attributes:
+        proc (str): The name of the proc
+        rate (float): The rate of the sample
+        scale (float): The scale of the rate adapted to the cost
+        budget (float): The time in seconds to spend populating the jobs of the
+            proc in a cycle, `0` to not adapt
+        failed (bool): Whether to also populate the failed jobs not sampled
+    """
+
+    __slots__ = ("proc", "rate", "scale", "budget", "failed")
+
+    MIN_SCALE = 0.01
+
+    def __init__(
+        self,
+        proc: str,
+        size: int,
+        sample: float | int,
+        budget: float = 0.0,
+        failed: bool = True,
+    ) -> None:
+        self.proc = proc
+        if isinstance(sample, float) and 0 < sample < 1:
+            self.rate = sample
+        elif isinstance(sample, int) and not isinstance(sample, bool) and sample > 0:
+            # the sample-th smallest key, so exactly `sample` jobs are sampled
+            keys = sorted(self.key(proc, i) for i in range(size))
+            self.rate = keys[sample - 1] if sample < size else 1.0
+        else:
+            raise ValueError(
+                f"Invalid poplog_sample: {sample!r}, expected a fraction in (0, 1) "
+                "or a positive number of jobs"
+            )
+        self.scale = 1.0
+        self.budget = budget
+        self.failed = failed
+
+    @staticmethod
+    def key(proc: str, index: int) -> float:
+        """Get the key of a job in [0, 1)"""
+        digest = hashlib.blake2b(f"{proc}:{index}".encode(), digest_size=8).digest()
+        return int.from_bytes(digest, "big") / 2**64
+
+    def sampled(self, index: int) -> bool:
+        """Whether the job is sampled"""
+        return self.key(self.proc, index) <= self.rate * self.scale
+
+    def adapt(self, cost: float) -> None:
+        """Adapt the rate to the time spent populating the jobs in a cycle"""
+        if self.budget <= 0:
+            return
+        if cost > self.budget:
+            self.scale = max(self.MIN_SCALE, self.scale / 2)
+        elif cost < self.budget / 2:
+            self.scale = min(1.0, self.scale * 1.25)
+
+
+class PopulatorEntry:
+    """A job registered to the populator scheduler
+
+    Attributes:
+        key (tuple[str, int]): The proc name and the job index
+        job (Job): The job
+        populator (LogsPopulator): The populator of the stdout/stderr file
+        matcher (PoplogMatcher): The matcher of the rules of the proc
+        flush_interval (float): The flush interval of the proc
+        aggregator (MessageAggregator | None): The aggregator of the messages
+            of the proc, if enabled
+        selected (bool): Whether the job is selected on purpose (in
+            `poplog_jobs`, sampled or failed), so that its messages are logged
+            whatever its index is
+        due (int): The cycle when the job is next due to be populated
+        cost (float): The time in seconds spent on the last visit
+        activity (float): The decaying sum of the bytes populated per visit
+        idle (int): The number of consecutive visits with nothing populated
+        errors (int): The number of visits failed with errors
+    """
+
+    __slots__ = (
+        "key",
+        "job",
+        "populator",
+        "matcher",
+        "flush_interval",
+        "aggregator",
+        "selected",
+        "due",
+        "cost",
+        "activity",
+        "idle",
+        "errors",
+    )
+
+    def __init__(
+        self,
+        job: Job,
+        populator: LogsPopulator,
+        matcher: PoplogMatcher,
+        flush_interval: float,
+        aggregator: MessageAggregator | None = None,
+        selected: bool = False,
+    ) -> None:
+        self.key = (job.proc.name, job.index)
+        self.job = job
+        self.populator = populator
+        self.matcher = matcher
+        self.flush_interval = flush_interval
+        self.aggregator = aggregator
+        self.selected = selected
+        self.due = 0
+        self.cost = 0.0
+        self.activity = 0.0
+        self.idle = 0
+        self.errors = 0
+
+    @property
+    def log_limit(self) -> int:
+        """The limit of `job.log()` for the messages of the job
+
+        The jobs selected on purpose are always logged, as well as the jobs
+        with the aggregator, which limits the volume instead.
+        """
+        if self.selected or self.aggregator is not None:
+            return self.job.index
+        return 3
+
+
+class PopulatorScheduler:
+    """Populate the logs of all the registered jobs of the pipeline in a single
+    long-lived asyncio task
+
+    A cycle runs every `interval` seconds. The jobs are kept in a heap keyed by
+    the cycle they are next due and their recent activity, so that the busy
+    jobs are visited first among the ones due in the same cycle. A cycle visits
+    the due jobs until its budget (the time spent and the bytes populated,
+    checked between the jobs) runs out, and the ones left are visited first in
+    the next cycle. Idle jobs back off exponentially, up to `max_interval`.
+
+    Attributes:
+        visit (Callable): The coroutine function to populate a job with the
+            entry and the cycle, returning the number of bytes populated
+        end_cycle (Callable): The function to call with the visited entries
+            at the end of each cycle
+        interval (float): The interval between the cycles in seconds
+        max_steps (int): The max number of cycles for idle jobs to back off
+        cycle_time (float): The max time in seconds to spend in a cycle
+        cycle_bytes (int): The max number of bytes to populate in a cycle
+            (`0` for no limit)
+        entries (dict[tuple[str, int], PopulatorEntry]): The registered jobs
+        heap (list[tuple]): The heap of (due, -activity, seq, entry)
+        cycle (int): The number of the current cycle
+        errors (int): The number of the failed calls to `end_cycle`
+        lock (asyncio.Lock): Held while a job is being visited
+        task (asyncio.Task | None): The task running the cycles
+    """
+
+    __slots__ = (
+        "visit",
+        "end_cycle",
+        "interval",
+        "max_steps",
+        "cycle_time",
+        "cycle_bytes",
+        "entries",
+        "heap",
+        "cycle",
+        "errors",
+        "lock",
+        "task",
+        "_seq",
+    )
+
+    def __init__(
+        self,
+        visit: Callable[[PopulatorEntry, int], Awaitable[int]],
+        end_cycle: Callable[[list[PopulatorEntry]], None],
+        interval: float = 1.0,
+        max_interval: float = 8.0,
+        cycle_time: float = 0.25,
+        cycle_bytes: int = 16 * 1024 * 1024,
+    ) -> None:
+        self.visit = visit
+        self.end_cycle = end_cycle
+        self.interval = interval
+        self.max_steps = max(1, int(max_interval / interval))
+        self.cycle_time = cycle_time
+        self.cycle_bytes = cycle_bytes
+        self.entries: dict[tuple[str, int], PopulatorEntry] = {}
+        self.heap: list[tuple[int, float, int, PopulatorEntry]] = []
+        self.cycle = 0
+        self.errors = 0
+        self.lock = asyncio.Lock()
+        self.task: asyncio.Task | None = None
+        self._seq = 0
+
+    def _push(self, entry: PopulatorEntry) -> None:
+        """Push an entry to the heap"""
+        self._seq += 1
+        heapq.heappush(self.heap, (entry.due, -entry.activity, self._seq, entry))
+
+    def register(self, entry: PopulatorEntry) -> None:
+        """Register a job, to be visited at least one interval later
+
+        Like the first polling of the job, this gives the job wrapper time to
+        set up the output files (e.g. truncated when the command is run).
+        """
+        entry.due = self.cycle + 2
+        self.entries[entry.key] = entry
+        self._push(entry)
+
+    async def unregister(self, key: tuple[str, int]) -> PopulatorEntry | None:
+        """Unregister a job, waiting for the visit to it in progress if any
+
+        Returns:
+            The entry of the job, or None if it is not registered
+        """
+        async with self.lock:
+            return self.entries.pop(key, None)
+
+    async def run_cycle(self) -> None:
+        """Visit the due jobs within the budget of a cycle"""
+        loop = asyncio.get_running_loop()
+        self.cycle += 1
+        started = loop.time()
+        nbytes = 0
+        visited = []
+        while self.heap and self.heap[0][0] <= self.cycle:
+            if loop.time() - started >= self.cycle_time or (
+                0 < self.cycle_bytes <= nbytes
+            ):
+                break
+
+            entry = heapq.heappop(self.heap)[-1]
+            async with self.lock:
+                # unregistered (or registered again) since pushed
+                if self.entries.get(entry.key) is not entry:
+                    continue
+
+                visit_started = loop.time()
+                try:
+                    populated = await self.visit(entry, self.cycle)
+                except Exception as exc:
+                    populated = 0
+                    entry.errors += 1
+                    if entry.errors == 1:
+                        entry.job.log(
+                            "warning",
+                            f"Failed to populate logs: {exc!r}".replace("%", "%%"),
+                            logger=logger,
+                        )
+                entry.cost = loop.time() - visit_started
+
+            nbytes += populated
+            visited.append(entry)
+            entry.activity = entry.activity / 2 + populated
+            entry.idle = 0 if populated else entry.idle + 1
+            entry.due = self.cycle + min(2 ** min(entry.idle, 16), self.max_steps)
+            self._push(entry)
+
+        try:
+            self.end_cycle(visited)
+        except Exception as exc:
+            # keep the cycles running, logged once like the failed visits
+            self.errors += 1
+            if self.errors == 1:
+                logger.warning("Failed to end the populator cycle: %r", exc)
+
+    async def _run(self) -> None:
+        """Run the cycles every interval"""
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await self.run_cycle()
+            await asyncio.sleep(
+                max(0.0, self.interval - (loop.time() - started))
+            )
+
+    def start(self) -> None:
+        """Start the task running the cycles"""
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the task, the visit in progress is finished first"""
+        if self.task is None:
+            return
+
+        async with self.lock:
+            self.task.cancel()
+        with suppress(asyncio.CancelledError):
+            await self.task
+        self.task = None
+
+
+BUFFERING_MODES = ("none", "line", "env", "pty")
+# Environment variables to disable the output buffering of the runtimes
+# that manage their own buffers, so `stdbuf` has no effect on them
+UNBUFFERED_ENVS = {
+    "PYTHONUNBUFFERED": "1",
+    "GFORTRAN_UNBUFFERED_PRECONNECTED": "y",
+}
+# Run the command with its stdout attached to a pseudo-terminal, so that
+# the programs line-buffer it as they do for a terminal, and copy the output
+# to the real stdout. stdin and stderr are left untouched. Only the APIs
+# available in old python3 versions (e.g. on HPC nodes) are used.
+PTY_WRAPPER = r"""
+import os, sys, termios
+master, slave = os.openpty()
+attrs = termios.tcgetattr(slave)
+attrs[1] &= ~termios.OPOST
+termios.tcsetattr(slave, termios.TCSANOW, attrs)
+pid = os.fork()
+if pid == 0:
+    os.close(master)
+    os.dup2(slave, 1)
+    os.close(slave)
+    os.execvp(sys.argv[1], sys.argv[1:])
+os.close(slave)
+while True:
+    try:
+        data = os.read(master, 65536)
+    except OSError:
+        break
+    if not data:
+        break
+    while data:
+        data = data[os.write(1, data):]
+status = os.waitpid(pid, 0)[1]
+if os.WIFSIGNALED(status):
+    sys.exit(128 + os.WTERMSIG(status))
+sys.exit(os.WEXITSTATUS(status))
+"""
+
+
+def jobcmd_buffering(
+    mode: str,
+    cmd: Sequence[str],
+    envs: Mapping[str, Any] | None = None,
+) -> str:
+    """Get the bash code to control the output buffering of the job command
+
+    Args:
+        mode: The buffering mode
+            - none: Leave the command as is, for the max throughput
+            - line: Line-buffer the stdout with `stdbuf -oL` (libc programs)
+            - env: `line` plus the environment variables to unbuffer the
+              runtimes with their own buffers (e.g. python)
+            - pty: `env` plus running the command with its stdout attached to
+              a pseudo-terminal (requires `python3` where the job runs),
+              falls back to `env` if not possible
+        cmd: The job command, to be replaced by the wrapped one in `$cmd`
+        envs: Extra environment variables for the `env` and `pty` modes,
+            `None` values to remove the default ones
+
+    Returns:
+        The bash code to be inserted before the command is run
+    """
+    if mode not in BUFFERING_MODES:
+        raise ValueError(
+            f"Invalid poplog_buffering: {mode!r}, "
+            f"expected one of {BUFFERING_MODES}"
+        )
+    if mode == "none":
+        return ""
+
+    codes = ["# by pipen_poplog"]
+    if mode != "line":
+        envs = {**UNBUFFERED_ENVS, **(envs or {})}
+        codes.extend(
+            f"export {key}={shlex.quote(str(value))}"
+            for key, value in envs.items()
+            if value is not None
+        )
+
+    if mode != "pty":
+        # let the script flush each newline
+        codes.append('cmd="stdbuf -oL $cmd"')
+        return "\n".join(codes)
+
+    orig = shlex.join(cmd)
+    wrapped = shlex.join(["python3", "-c", PTY_WRAPPER, *cmd])
+    codes.append(f"poplog_orig={shlex.quote(orig)}")
+    codes.append(f"poplog_wrapped={shlex.quote(wrapped)}")
+    codes.append(
+        'if command -v python3 >/dev/null 2>&1 '
+        '&& [[ "$cmd" == *"$poplog_orig"* ]]; then\n'
+        '    cmd="${cmd/"$poplog_orig"/"$poplog_wrapped"}"\n'
+        "else\n"
+        '    cmd="stdbuf -oL $cmd"\n'
+        "fi"
+    )
+    return "\n".join(codes)
+
+
 class PipenPoplogPlugin(metaclass=Singleton):
     """Populate logs from stdout/stderr to pipen runnning logs"""
 
@@ -168,16 +2111,36 @@ class PipenPoplogPlugin(metaclass=Singleton):
     # this is to ensure that the logs are written to the file and uploaded if
     # using cloud files for logging
     __slots__ = (
-        "populators",
+        "scheduler",
+        "matchers",
+        "aggregators",
+        "samplers",
+        "listers",
         "flushing_handlers",
-        "_last_flush_time",
+        "queue_listener",
+        "flush_policy",
+        "index",
+        "flush_interval",
+        "ring_file",
+        "_ring_signal",
         "_job_started_populating",
     )
 
     def __init__(self) -> None:
-        self.populators: dict[int, LogsPopulator] = {}
+        # Created when the pipeline starts
+        self.scheduler: PopulatorScheduler | None = None
+        self.matchers: dict[str, PoplogMatcher] = {}
+        self.aggregators: dict[str, MessageAggregator] = {}
+        self.samplers: dict[str, JobSampler] = {}
+        self.listers: dict[str, CloudJobLister] = {}
         self.flushing_handlers: set[logging.Handler] = set()
-        self._last_flush_time: float = 0.0
+        # PoplogQueueListener, built lazily
+        self.queue_listener: Any = None
+        self.flush_policy = FlushPolicy()
+        self.index: PoplogIndex | None = None
+        self.flush_interval = self.__class__.DEFAULT_FLUSH_INTERVAL
+        self.ring_file: str | None = None
+        self._ring_signal: int | None = None
         self._job_started_populating: bool = False
 
     async def _is_mounted_filesystem(self, path: str) -> bool:
@@ -268,59 +2231,333 @@ class PipenPoplogPlugin(metaclass=Singleton):
         the bucket mounted via gcsfuse. The log files are written to the mounted
         bucket, which is a remote filesystem. Without flushing, the logs may not
         be written promptly, leading to delays in log visibility.
+
+        When the flush is due is decided by the flush policy, see `FlushPolicy`.
+
+        When the records are emitted via the queue (`poplog_queue`), the flushing
+        is done in the background thread of the queue listener.
         """
         if not self.flushing_handlers:
             return
 
-        if time.time() - self._last_flush_time < flush_interval:
+        if not self.flush_policy.due(flush_interval):
             return
 
-        self._last_flush_time = time.time()
-        for h in self.flushing_handlers:
-            with suppress(Exception):
-                h.stream.flush()
-                # This will force the mounting tool (e.g. gcsfuse) to upload the data
-                os.fsync(h.stream.fileno())
+        self.flush_policy.flushed()
+        if self.queue_listener:
+            self.queue_listener.request_flush()
+        else:
+            _fsync_handlers(self.flushing_handlers)
+
+    def _get_matcher(self, proc: Proc) -> PoplogMatcher:
+        """Get the matcher of the rules for the proc, compiled once per proc"""
+        if proc.name not in self.matchers:
+            rules = proc.plugin_opts.get("poplog_rules") or [
+                proc.plugin_opts.get("poplog_pattern", PATTERN)
+            ]
+            self.matchers[proc.name] = PoplogMatcher(rules)
+            if self.queue_listener:
+                for rule in self.matchers[proc.name].rules:
+                    self.queue_listener.attach(rule.logger)
+
+        return self.matchers[proc.name]
+
+    def _get_aggregator(self, proc: Proc) -> MessageAggregator | None:
+        """Get the aggregator of the messages of the proc, if enabled"""
+        poplog_aggregate = proc.plugin_opts.get("poplog_aggregate", False)
+        if not poplog_aggregate:
+            return None
+
+        if proc.name not in self.aggregators:
+            self.aggregators[proc.name] = MessageAggregator(
+                # True to use the default number
+                3 if poplog_aggregate is True else poplog_aggregate,
+                proc.plugin_opts.get("poplog_aggregate_templates", 1000),
+            )
+
+        return self.aggregators[proc.name]
+
+    def _get_sampler(self, proc: Proc) -> JobSampler | None:
+        """Get the sampler of the jobs of the proc, if enabled"""
+        poplog_sample = proc.plugin_opts.get("poplog_sample")
+        if not poplog_sample:
+            return None
+
+        if proc.name not in self.samplers:
+            self.samplers[proc.name] = JobSampler(
+                proc.name,
+                proc.size,
+                poplog_sample,
+                budget=proc.plugin_opts.get("poplog_sample_budget", 0.1),
+                failed=proc.plugin_opts.get("poplog_sample_failed", True),
+            )
+
+        return self.samplers[proc.name]
 
-    def _clear_residues(self, job: Job) -> None:
-        """Clear residues in all populators"""
-        if job.index not in self.populators:
+    def _register(self, job: Job, selected: bool = False) -> None:
+        """Create the populator for the job and register it to the scheduler
+
+        Args:
+            job: The job
+            selected: Whether the job is selected on purpose, see
+                `PopulatorEntry.selected`
+        """
+        if (
+            self.scheduler is None
+            or (job.proc.name, job.index) in self.scheduler.entries
+        ):
             return
 
-        populator = self.populators[job.index]
-        poplog_pattern = re.compile(job.proc.plugin_opts.get("poplog_pattern", PATTERN))
+        if job.proc.plugin_opts.poplog_source == "stdout":
+            logfile = job.stdout_file
+        else:
+            logfile = job.stderr_file
 
-        poplog_flush_interval = job.proc.plugin_opts.get(
-            "poplog_flush_interval",
-            self.__class__.DEFAULT_FLUSH_INTERVAL,
+        lister = self._get_lister(job.proc, logfile)
+        if lister is not None:
+            lister.jobs.add(job.index)
+
+        poplog_max = job.proc.plugin_opts.get("poplog_max", 0)
+        populator = LogsPopulator(
+            logfile,
+            max=poplog_max,
+            hit_message=(
+                f"Max messages reached ({poplog_max}), "
+                "check stdout/stderr files for more."
+            ),
+            lister=lister,
+            store=(
+                CloudObjectStore.for_path(logfile)
+                if job.proc.plugin_opts.get("poplog_cloud_ranged", True)
+                else None
+            ),
+            chunk_size=job.proc.plugin_opts.get(
+                "poplog_cloud_chunk",
+                8 * 1024 * 1024,
+            ),
+            start=job.proc.plugin_opts.get("poplog_start", "beginning"),
+            track_offsets=self.index is not None,
+            compression=job.proc.plugin_opts.get("poplog_compression", "auto"),
+            ring_bytes=job.proc.plugin_opts.get("poplog_ring_bytes", 0),
+            ring_lines=job.proc.plugin_opts.get("poplog_ring_lines", 100),
+        )
+        self.scheduler.register(
+            PopulatorEntry(
+                job,
+                populator,
+                self._get_matcher(job.proc),
+                job.proc.plugin_opts.get(
+                    "poplog_flush_interval",
+                    self.__class__.DEFAULT_FLUSH_INTERVAL,
+                ),
+                self._get_aggregator(job.proc),
+                selected,
+            )
+        )
+
+    def _get_lister(self, proc: Proc, logfile: Any) -> CloudJobLister | None:
+        """Get the lister of the cloud log files for the proc, shared by the jobs"""
+        poplog_cloud_batch = proc.plugin_opts.get("poplog_cloud_batch", True)
+        if not poplog_cloud_batch:
+            return None
+
+        if proc.name not in self.listers:
+            store = CloudObjectStore.for_path(logfile)
+            if store is None:
+                return None
+            # <proc workdir>/<job index>/job.stdout
+            self.listers[proc.name] = CloudJobLister(
+                store,
+                logfile.parent.parent,
+                # True to use the default number
+                min_jobs=8 if poplog_cloud_batch is True else poplog_cloud_batch,
+            )
+
+        return self.listers[proc.name]
+
+    def _populate_line(
+        self,
+        entry: PopulatorEntry,
+        line: str,
+        offset: int | None = None,
+    ) -> None:
+        """Match a line and log the message if matched and not filtered"""
+        matched = entry.matcher.match(line)
+        if not matched:
+            return
+
+        job = entry.job
+
+        # Only messages with levels not less than poplog_loglevel are returned
+        # by the matcher, and they are counted
+        rule, levelno, msg = matched
+        if self.index is not None:
+            self.index.add(
+                job.proc.name,
+                job.index,
+                levelno,
+                job.proc.plugin_opts.get("poplog_source", "stdout"),
+                offset,
+                msg,
+            )
+        if entry.aggregator is not None and not entry.aggregator.add(levelno, msg):
+            return
+
+        # escape % in the message to avoid formatting issues in logger
+        msg = msg.replace("%", "%%")
+        job.log(
+            levelno,
+            msg,
+            limit=entry.log_limit,
+            limit_indicator=False,
+            logger=rule.logger,
+        )
+        self.flush_policy.record(levelno, len(msg))
+        entry.populator.increment_counter()
+
+    async def _populate_job(self, entry: PopulatorEntry, cycle: int) -> int:
+        """Populate the new lines of a job, visited by the scheduler
+
+        Returns:
+            The number of bytes populated
+        """
+        populator = entry.populator
+        lines = await populator.populate(cycle)
+        nbytes = 0
+        for i, line in enumerate(lines):
+            nbytes += len(line) + 1
+            if populator.max_hit:
+                line = line.replace("%", "%%")
+                entry.job.log(
+                    "warning",
+                    line,
+                    limit=entry.log_limit,
+                    limit_indicator=False,
+                    logger=logger,
+                )
+                self.flush_policy.record(logging.WARNING, len(line))
+                break
+
+            self._populate_line(
+                entry,
+                line,
+                populator.offsets[i] if populator.track_offsets else None,
+            )
+
+        return nbytes
+
+    def _end_cycle(self, visited: list[PopulatorEntry]) -> None:
+        """Commit the indexed messages, adapt the sample rates to the cost and
+        flush the handlers after a cycle"""
+        if self.index is not None:
+            self.index.commit()
+
+        if self.samplers:
+            costs: dict[str, float] = {}
+            for entry in visited:
+                costs[entry.key[0]] = costs.get(entry.key[0], 0.0) + entry.cost
+            for proc_name, cost in costs.items():
+                if proc_name in self.samplers:
+                    self.samplers[proc_name].adapt(cost)
+
+        self._flush_hanlders(
+            min(entry.flush_interval for entry in visited)
+            if visited
+            else self.flush_interval
         )
 
+    def _clear_residues(self, entry: PopulatorEntry) -> None:
+        """Populate the residue (the last line without a newline) of a job"""
+        populator = entry.populator
         if populator.residue:
             line = populator.residue.decode()
+            offset = populator.residue_offset
             populator.residue = b""
 
             if populator.max_hit:
                 return
 
-            match = poplog_pattern.match(line)
-            if not match:
-                return
+            self._populate_line(entry, line, offset)
 
-            level = match.group("level").lower()
-            level = levels.get(level, level)
-            msg = match.group("message").rstrip()
-            msg = msg.replace("%", "%%")
-            job.log(level, msg, limit_indicator=False, logger=logger)
-            self._flush_hanlders(poplog_flush_interval)
+    def dump_output(self, path: str | Path | None = None) -> int:
+        """Dump the most recent output of the jobs being populated
 
-            # count only when level is larger than poplog_loglevel
-            levelno = logging._nameToLevel.get(level.upper(), 0)
-            base_logger = getattr(logger, "logger", logger)
-            if (
-                not isinstance(levelno, int)
-                or levelno >= base_logger.getEffectiveLevel()
-            ):
-                populator.increment_counter()
+        The output is kept in the ring buffers of the populators (see
+        `plugin_opts.poplog_ring_bytes`), so nothing is read from the storage.
+
+        Args:
+            path: The file to write the output to, or the pipeline log if None
+
+        Returns:
+            The number of jobs dumped
+        """
+        entries = [
+            entry
+            for entry in (self.scheduler.entries if self.scheduler else {}).values()
+            if entry.populator.ring is not None
+        ]
+        blocks = []
+        for entry in entries:
+            lines = entry.populator.ring.lines()
+            blocks.append(
+                "\n".join(
+                    [f"Recent output ({len(lines)} line(s)):"]
+                    + [f"  {line}" for line in lines]
+                )
+            )
+
+        if path is None:
+            for entry, block in zip(entries, blocks):
+                # limit=job.index: always log for the dumped jobs
+                entry.job.log(
+                    "info",
+                    block.replace("%", "%%"),
+                    limit=entry.job.index,
+                    limit_indicator=False,
+                    logger=logger,
+                )
+            self.flush_policy.record(logging.INFO, sum(map(len, blocks)))
+            self._flush_hanlders(0)
+        else:
+            with open(path, "w") as f:
+                for entry, block in zip(entries, blocks):
+                    f.write(f"# {entry.key[0]}: [{entry.key[1]}]\n{block}\n")
+
+        return len(entries)
+
+    def _on_ring_signal(self) -> None:
+        """Dump the output on the signal"""
+        try:
+            ndumped = self.dump_output(self.ring_file)
+        except OSError as exc:
+            logger.warning("Failed to dump the recent output: %s", exc)
+        else:
+            if self.ring_file:
+                logger.info(
+                    "Recent output of %s job(s) dumped to %s",
+                    ndumped,
+                    self.ring_file,
+                )
+
+    async def _final_sweep(self, job: Job, *suppressed: type[Exception]) -> None:
+        """Unregister a done job and populate the rest of its file"""
+        if self.scheduler is None:
+            return
+
+        entry = await self.scheduler.unregister((job.proc.name, job.index))
+        if entry is None:
+            return
+
+        lister = self.listers.get(job.proc.name)
+        if lister is not None:
+            lister.jobs.discard(job.index)
+
+        with suppress(*suppressed):
+            # -1: the final sweep, not in a poll cycle
+            await self._populate_job(entry, -1)
+        self._clear_residues(entry)
+        await entry.populator.destroy()
+        self._flush_hanlders(entry.flush_interval)
 
     @plugin.impl
     async def on_init(self, pipen: Pipen):
@@ -328,13 +2565,45 @@ class PipenPoplogPlugin(metaclass=Singleton):
         # default options
         pipen.config.plugin_opts.setdefault("poplog_loglevel", "info")
         pipen.config.plugin_opts.setdefault("poplog_pattern", PATTERN)
+        pipen.config.plugin_opts.setdefault("poplog_rules", [])
         pipen.config.plugin_opts.setdefault("poplog_jobs", [])
         pipen.config.plugin_opts.setdefault("poplog_source", "stdout")
         pipen.config.plugin_opts.setdefault("poplog_max", 0)
+        pipen.config.plugin_opts.setdefault("poplog_sample", None)
+        pipen.config.plugin_opts.setdefault("poplog_sample_failed", True)
+        pipen.config.plugin_opts.setdefault("poplog_sample_budget", 0.1)
+        pipen.config.plugin_opts.setdefault("poplog_start", "beginning")
+        pipen.config.plugin_opts.setdefault("poplog_compression", "auto")
         pipen.config.plugin_opts.setdefault(
             "poplog_flush_interval",
             self.__class__.DEFAULT_FLUSH_INTERVAL,
         )
+        pipen.config.plugin_opts.setdefault("poplog_flush_level", "error")
+        pipen.config.plugin_opts.setdefault("poplog_flush_records", 100)
+        pipen.config.plugin_opts.setdefault("poplog_flush_bytes", 65536)
+        pipen.config.plugin_opts.setdefault("poplog_failure_tail", 0)
+        pipen.config.plugin_opts.setdefault("poplog_failure_tail_bytes", 8192)
+        pipen.config.plugin_opts.setdefault("poplog_cloud_batch", True)
+        pipen.config.plugin_opts.setdefault("poplog_cloud_ranged", True)
+        pipen.config.plugin_opts.setdefault("poplog_cloud_chunk", 8 * 1024 * 1024)
+        pipen.config.plugin_opts.setdefault("poplog_index", False)
+        pipen.config.plugin_opts.setdefault("poplog_queue", 0)
+        pipen.config.plugin_opts.setdefault("poplog_queue_overflow", "drop")
+        pipen.config.plugin_opts.setdefault("poplog_poll_interval", 1.0)
+        pipen.config.plugin_opts.setdefault("poplog_poll_max_interval", 8.0)
+        pipen.config.plugin_opts.setdefault("poplog_cycle_time", 0.25)
+        pipen.config.plugin_opts.setdefault(
+            "poplog_cycle_bytes",
+            16 * 1024 * 1024,
+        )
+        pipen.config.plugin_opts.setdefault("poplog_aggregate", False)
+        pipen.config.plugin_opts.setdefault("poplog_aggregate_templates", 1000)
+        pipen.config.plugin_opts.setdefault("poplog_ring_bytes", 0)
+        pipen.config.plugin_opts.setdefault("poplog_ring_lines", 100)
+        pipen.config.plugin_opts.setdefault("poplog_ring_signal", "SIGUSR1")
+        pipen.config.plugin_opts.setdefault("poplog_ring_file", None)
+        pipen.config.plugin_opts.setdefault("poplog_buffering", "line")
+        pipen.config.plugin_opts.setdefault("poplog_buffering_envs", {})
 
     @plugin.impl
     async def on_start(self, pipen: Pipen):
@@ -355,6 +2624,110 @@ class PipenPoplogPlugin(metaclass=Singleton):
 
             self.flushing_handlers.add(h)
 
+        self.flush_policy = FlushPolicy(
+            urgent_level=pipen.config.plugin_opts.get("poplog_flush_level", "error"),
+            max_records=pipen.config.plugin_opts.get("poplog_flush_records", 100),
+            max_bytes=pipen.config.plugin_opts.get("poplog_flush_bytes", 65536),
+        )
+
+        poplog_index = pipen.config.plugin_opts.get("poplog_index", False)
+        if poplog_index:
+            index_file = (
+                PanPath(pipen.workdir) / PoplogIndex.FILENAME
+                if poplog_index is True
+                else PanPath(poplog_index)
+            )
+            if isinstance(index_file, CloudPath):
+                logger.warning(
+                    "Poplog index can't be created in a cloud workdir, "
+                    "set poplog_index to a local file path instead."
+                )
+            else:
+                self.index = PoplogIndex(index_file, reset=True)
+
+        poplog_queue = pipen.config.plugin_opts.get("poplog_queue", 0)
+        if poplog_queue:
+            self.queue_listener = _lazy("PoplogQueueListener")(
+                # True to use the default size
+                1000 if poplog_queue is True else poplog_queue,
+                overflow=pipen.config.plugin_opts.get("poplog_queue_overflow", "drop"),
+                flushing_handlers=self.flushing_handlers,
+            )
+            self.queue_listener.attach(logger)
+            self.queue_listener.start()
+
+        self.flush_interval = pipen.config.plugin_opts.get(
+            "poplog_flush_interval",
+            self.__class__.DEFAULT_FLUSH_INTERVAL,
+        )
+        self.scheduler = PopulatorScheduler(
+            self._populate_job,
+            self._end_cycle,
+            interval=pipen.config.plugin_opts.get("poplog_poll_interval", 1.0),
+            max_interval=pipen.config.plugin_opts.get(
+                "poplog_poll_max_interval",
+                8.0,
+            ),
+            cycle_time=pipen.config.plugin_opts.get("poplog_cycle_time", 0.25),
+            cycle_bytes=pipen.config.plugin_opts.get(
+                "poplog_cycle_bytes",
+                16 * 1024 * 1024,
+            ),
+        )
+        self.scheduler.start()
+
+        ring_signal = pipen.config.plugin_opts.get("poplog_ring_signal", "SIGUSR1")
+        if pipen.config.plugin_opts.get("poplog_ring_bytes", 0) > 0 and ring_signal:
+            self.ring_file = pipen.config.plugin_opts.get("poplog_ring_file")
+            signum = getattr(signal, str(ring_signal).upper(), ring_signal)
+            try:
+                asyncio.get_running_loop().add_signal_handler(
+                    signum,
+                    self._on_ring_signal,
+                )
+            # Not supported on Windows, or invalid signal
+            except (NotImplementedError, RuntimeError, TypeError, ValueError):
+                logger.warning(
+                    "Can't dump the recent output on signal: %s",
+                    ring_signal,
+                )
+            else:
+                self._ring_signal = signum
+
+    @plugin.impl
+    async def on_complete(self, pipen: Pipen, succeeded: bool):
+        """Flush the pending records, and drain the queue and restore the
+        handlers if poplog_queue is enabled"""
+        if self.scheduler is not None:
+            await self.scheduler.stop()
+            self.scheduler = None
+        if self._ring_signal is not None:
+            asyncio.get_running_loop().remove_signal_handler(self._ring_signal)
+            self._ring_signal = None
+        if self.index is not None:
+            self.index.close()
+            self.index = None
+
+        if not self.queue_listener:
+            # flush regardless of the interval
+            self._flush_hanlders(0)
+            return
+
+        # stop() processes all the records in the queue before returning
+        await asyncio.get_running_loop().run_in_executor(
+            None, self.queue_listener.stop
+        )
+        self.queue_listener.detach_all()
+        _fsync_handlers(self.flushing_handlers)
+        self.flush_policy.flushed()
+        dropped = self.queue_listener.queue_handler.dropped
+        self.queue_listener = None
+        if dropped:
+            logger.warning(
+                "%s poplog message(s) dropped due to full queue (poplog_queue).",
+                dropped,
+            )
+
     @plugin.impl
     def on_proc_create(self, proc: Proc):
         """Cluster first running job index"""
@@ -369,6 +2742,13 @@ class PipenPoplogPlugin(metaclass=Singleton):
         if not isinstance(poplog_jobs, (list, tuple)):
             poplog_jobs = [poplog_jobs]
 
+        sampler = self._get_sampler(job.proc)
+        if sampler is not None:
+            # the sampled jobs, in addition to the ones in poplog_jobs
+            if job.index in poplog_jobs or sampler.sampled(job.index):
+                self._register(job, selected=True)
+            return
+
         if poplog_jobs and job.index not in poplog_jobs:
             return
 
@@ -378,93 +2758,79 @@ class PipenPoplogPlugin(metaclass=Singleton):
         if not poplog_jobs and not self._job_started_populating:
             self._job_started_populating = True
 
-        if job.proc.plugin_opts.poplog_source == "stdout":
-            logfile = job.stdout_file
-        else:
-            logfile = job.stderr_file
-
-        if job.index not in self.populators:
-            poplog_max = job.proc.plugin_opts.get("poplog_max", 0)
-            self.populators[job.index] = LogsPopulator(
-                logfile,
-                max=poplog_max,
-                hit_message=(
-                    f"Max messages reached ({poplog_max}), "
-                    "check stdout/stderr files for more."
-                ),
-            )
-
-    @plugin.impl
-    async def on_job_polling(self, job: Job, counter: int):
-        """Poll the job's stdout/stderr file and populate the logs"""
-        if job.index not in self.populators:
-            return
-
-        proc = job.proc
-        populator = self.populators[job.index]
-
-        poplog_pattern = proc.plugin_opts.get("poplog_pattern", PATTERN)
-        poplog_pattern = re.compile(poplog_pattern)
-
-        poplog_flush_interval = proc.plugin_opts.get(
-            "poplog_flush_interval",
-            self.__class__.DEFAULT_FLUSH_INTERVAL,
-        )
-
-        lines = await populator.populate()
-        for line in lines:
-            if populator.max_hit:
-                line = line.replace("%", "%%")
-                job.log("warning", line, limit_indicator=False, logger=logger)
-                break
-
-            match = poplog_pattern.match(line)
-            if not match:
-                continue
-
-            level = match.group("level").lower()
-            level = levels.get(level, level)
-            msg = match.group("message").rstrip()
-            # escape % in the message to avoid formatting issues in logger
-            msg = msg.replace("%", "%%")
-            job.log(level, msg, limit_indicator=False, logger=logger)
-
-            # count only when level is larger than poplog_loglevel
-            levelno = logging._nameToLevel.get(level.upper(), 0)
-            if not isinstance(levelno, int) or levelno >= logger.getEffectiveLevel():
-                populator.increment_counter()
-
-        # flush all handlers
-        self._flush_hanlders(poplog_flush_interval)
+        self._register(job, selected=bool(poplog_jobs))
 
     @plugin.impl
     async def on_job_succeeded(self, job: Job):
-        await self.on_job_polling(job, 0)
-        self._clear_residues(job)
+        await self._final_sweep(job)
 
     @plugin.impl
     async def on_job_failed(self, job: Job):
-        with suppress(FileNotFoundError, AttributeError):
-            await self.on_job_polling(job, 0)
-        self._clear_residues(job)
+        sampler = self.samplers.get(job.proc.name)
+        if sampler is not None and sampler.failed:
+            # always populate the failed jobs, even if they are not sampled
+            self._register(job, selected=True)
+        await self._final_sweep(job, FileNotFoundError, AttributeError)
+
+        poplog_failure_tail = job.proc.plugin_opts.get("poplog_failure_tail", 0)
+        if poplog_failure_tail > 0:
+            lines = await read_tail(
+                job.stderr_file,
+                poplog_failure_tail,
+                job.proc.plugin_opts.get("poplog_failure_tail_bytes", 8192),
+            )
+            if lines:
+                msg = "\n".join(
+                    [f"Last {len(lines)} line(s) of stderr:"]
+                    + [f"  {line}" for line in lines]
+                ).replace("%", "%%")
+                # limit=job.index: always log for the failed jobs
+                job.log(
+                    "error",
+                    msg,
+                    limit=job.index,
+                    limit_indicator=False,
+                    logger=logger,
+                )
+                self.flush_policy.record(logging.ERROR, len(msg))
+                self._flush_hanlders(0)
 
     @plugin.impl
     async def on_job_killed(self, job: Job):
-        with suppress(FileNotFoundError, AttributeError):
-            await self.on_job_polling(job, 0)
-        self._clear_residues(job)
+        await self._final_sweep(job, FileNotFoundError, AttributeError)
 
     @plugin.impl
     async def on_proc_done(self, proc: Proc, succeeded: bool | str):
-        """Clear the populators after the proc is done"""
-        for populator in self.populators.values():
-            await populator.destroy()
-        self.populators.clear()
+        """Unregister the jobs of the proc left (e.g. not run to the end), and
+        log the summary of the aggregated messages"""
+        if self.scheduler is not None:
+            keys = [key for key in self.scheduler.entries if key[0] == proc.name]
+            for key in keys:
+                entry = await self.scheduler.unregister(key)
+                if entry is not None:
+                    await entry.populator.destroy()
+        if self.index is not None:
+            self.index.commit()
+
+        aggregator = self.aggregators.pop(proc.name, None)
+        summary = aggregator.summary() if aggregator else None
+        if summary:
+            proc.log("info", summary.replace("%", "%%"), logger=logger)
+            self.flush_policy.record(logging.INFO, len(summary))
+            self._flush_hanlders(0)
+
+        self.matchers.pop(proc.name, None)
+        self.samplers.pop(proc.name, None)
+        self.listers.pop(proc.name, None)
 
     @plugin.impl
     def on_jobcmd_prep(self, job: Job) -> str:
-        # let the script flush each newline
-        return '# by pipen_poplog\ncmd="stdbuf -oL $cmd"'
+        """Control the output buffering of the job command"""
+        return jobcmd_buffering(
+            job.proc.plugin_opts.get("poplog_buffering", "line"),
+            job.cmd,
+            job.proc.plugin_opts.get("poplog_buffering_envs"),
+        )
 
 
 poplog_plugin = PipenPoplogPlugin()
@@ -0,0 +1,64 @@
+import logging
+
+import pytest
+from pipen_poplog import MessageAggregator
+
+
+@pytest.mark.parametrize(
+    "msg,expected",
+    [
+        ("Loaded reference /data/ref1.fa", "Loaded reference <path>"),
+        ("Read gs://bucket/a/b.txt in 1.5s", "Read <path> in <number>s"),
+        ("Progress: 50% (3e-5 per read)", "Progress: <number>% (<number> per read)"),
+        ("chr1 v1.2.3 ref=/a/b", "chr1 v1.2.3 ref=<path>"),
+        ("no numbers", "no numbers"),
+    ],
+)
+def test_template(msg, expected):
+    """Test that the paths and numbers are masked."""
+    assert MessageAggregator.template(msg) == expected
+
+
+def test_add():
+    """Test that only the first messages of each template are to be logged."""
+    aggregator = MessageAggregator(live=2)
+    assert aggregator.add(logging.INFO, "Loaded /data/ref0.fa")
+    assert aggregator.add(logging.INFO, "Loaded /data/ref1.fa")
+    assert not aggregator.add(logging.INFO, "Loaded /data/ref2.fa")
+    # counted by level
+    assert aggregator.add(logging.WARNING, "Loaded /data/ref3.fa")
+    assert aggregator.counts == {
+        (logging.INFO, "Loaded <path>"): 3,
+        (logging.WARNING, "Loaded <path>"): 1,
+    }
+
+
+def test_max_templates():
+    """Test that the new templates are counted as others beyond the max."""
+    aggregator = MessageAggregator(live=1, max_templates=1)
+    assert aggregator.add(logging.INFO, "a")
+    assert aggregator.add(logging.INFO, "b")
+    assert not aggregator.add(logging.INFO, "c")
+    assert not aggregator.add(logging.INFO, "a")
+    assert aggregator.counts == {
+        (logging.INFO, "a"): 2,
+        (logging.INFO, MessageAggregator.OTHER): 2,
+    }
+
+
+def test_summary():
+    """Test the summary table."""
+    aggregator = MessageAggregator(live=1)
+    assert aggregator.summary() is None
+    aggregator.add(logging.INFO, "x 1")
+    assert aggregator.summary() is None
+
+    for i in range(10):
+        aggregator.add(logging.INFO, f"x {i}")
+    aggregator.add(logging.ERROR, "failed")
+    assert aggregator.summary() == (
+        "Message summary (12 message(s), 2 template(s)):\n"
+        "  LEVEL    COUNT  TEMPLATE\n"
+        "  ERROR        1  failed\n"
+        "  INFO        11  x <number>"
+    )
@@ -0,0 +1,107 @@
+import shutil
+import subprocess
+import sys
+
+import pytest
+from pipen_poplog import jobcmd_buffering
+
+SCRIPT = """
+import sys
+print("tty" if sys.stdout.isatty() else "notty")
+print("err", file=sys.stderr)
+sys.exit(3)
+"""
+
+
+def _run(code, tmp_path):
+    """Run the job command prepared by the code as xqute does"""
+    script = tmp_path / "job.py"
+    script.write_text(SCRIPT)
+    stdout = tmp_path / "job.stdout"
+    stderr = tmp_path / "job.stderr"
+    wrapper = (
+        f'cmd="{sys.executable} {script} 1>{stdout} 2>{stderr}"\n'
+        f"{code}\n"
+        'eval "$cmd"\n'
+    )
+    proc = subprocess.run(["bash", "-c", wrapper])
+    return proc.returncode, stdout.read_text(), stderr.read_text()
+
+
+def test_invalid_mode():
+    """Test that an invalid mode raises an error."""
+    with pytest.raises(ValueError):
+        jobcmd_buffering("full", ["bash", "job.script"])
+
+
+def test_none():
+    """Test that the command is left as is."""
+    assert jobcmd_buffering("none", ["bash", "job.script"]) == ""
+
+
+def test_line():
+    """Test that the stdout is line-buffered with stdbuf."""
+    code = jobcmd_buffering("line", ["bash", "job.script"])
+    assert 'cmd="stdbuf -oL $cmd"' in code
+    assert "export" not in code
+
+
+def test_env():
+    """Test that the environment variables are exported."""
+    code = jobcmd_buffering(
+        "env",
+        ["bash", "job.script"],
+        {"GFORTRAN_UNBUFFERED_PRECONNECTED": None, "MY_FLUSH": "a b"},
+    )
+    assert "export PYTHONUNBUFFERED=1" in code
+    assert "GFORTRAN_UNBUFFERED_PRECONNECTED" not in code
+    assert "export MY_FLUSH='a b'" in code
+    assert 'cmd="stdbuf -oL $cmd"' in code
+
+
+@pytest.mark.skipif(not shutil.which("bash"), reason="bash is required")
+def test_env_run(tmp_path):
+    """Test that the command runs in the env mode."""
+    code = jobcmd_buffering("env", [sys.executable, str(tmp_path / "job.py")])
+    rc, out, err = _run(code, tmp_path)
+    assert rc == 3
+    assert out == "notty\n"
+    assert err == "err\n"
+
+
+@pytest.mark.skipif(
+    not shutil.which("bash") or not shutil.which("python3"),
+    reason="bash and python3 are required",
+)
+def test_pty_run(tmp_path):
+    """Test that the stdout of the command is attached to a pty."""
+    code = jobcmd_buffering("pty", [sys.executable, str(tmp_path / "job.py")])
+    rc, out, err = _run(code, tmp_path)
+    assert rc == 3
+    # no \r\n translation
+    assert out == "tty\n"
+    assert err == "err\n"
+
+
+@pytest.mark.skipif(
+    not shutil.which("bash") or not shutil.which("python3"),
+    reason="bash and python3 are required",
+)
+def test_pty_run_killed(tmp_path):
+    """Test that a command killed by a signal exits with 128 + signum."""
+    script = tmp_path / "job.py"
+    script.write_text("import os, signal\nos.kill(os.getpid(), signal.SIGTERM)\n")
+    stdout = tmp_path / "job.stdout"
+    code = jobcmd_buffering("pty", [sys.executable, str(script)])
+    wrapper = f'cmd="{sys.executable} {script} 1>{stdout}"\n{code}\neval "$cmd"\n'
+    proc = subprocess.run(["bash", "-c", wrapper])
+    assert proc.returncode == 128 + 15
+
+
+@pytest.mark.skipif(not shutil.which("bash"), reason="bash is required")
+def test_pty_fallback(tmp_path):
+    """Test that stdbuf is used when the command is not found in $cmd."""
+    code = jobcmd_buffering("pty", ["other", "command"])
+    rc, out, err = _run(code, tmp_path)
+    assert rc == 3
+    assert out == "notty\n"
@@ -0,0 +1,157 @@
+import pytest  # noqa: F401
+from unittest.mock import Mock, AsyncMock, patch
+from diot import Diot
+from panpath import PanPath
+from pipen_poplog import (
+    CloudJobLister,
+    CloudObjectStore,
+    GSObjectStore,
+    LogsPopulator,
+    PipenPoplogPlugin,
+    PopulatorScheduler,
+    S3ObjectStore,
+)
+
+
+class FakeStore(CloudObjectStore):
+    """A store with the sizes of the objects in memory."""
+
+    def __init__(self, sizes):
+        self.sizes = sizes
+        self.calls = 0
+
+    async def list_sizes(self, prefix, names):
+        self.calls += 1
+        return {
+            path: size
+            for path, size in self.sizes.items()
+            if path.startswith(prefix) and path.rsplit("/", 1)[-1] in names
+        }
+
+    async def read_tail(self, path, nbytes):
+        raise NotImplementedError
+
+    async def read_range(self, path, start, end):
+        raise NotImplementedError
+
+
+def test_store_for_path():
+    """Test that stores are picked by the scheme of the paths."""
+    assert CloudObjectStore.for_path("/tmp/job.stdout") is None
+    assert isinstance(
+        CloudObjectStore.for_path(PanPath("gs://bucket/proc/0/job.stdout")),
+        GSObjectStore,
+    )
+    assert isinstance(
+        CloudObjectStore.for_path(PanPath("s3://bucket/proc/0/job.stdout")),
+        S3ObjectStore,
+    )
+
+
+async def test_lister_lists_once_per_cycle():
+    """Test that the lister lists only once in a poll cycle."""
+    store = FakeStore(
+        {
+            "gs://b/proc/0/job.stdout": 10,
+            "gs://b/proc/1/job.stdout": 20,
+            "gs://b/proc/1/output/x.txt": 30,
+        }
+    )
+    lister = CloudJobLister(store, "gs://b/proc")
+
+    assert await lister.size("gs://b/proc/0/job.stdout", 1) == 10
+    assert await lister.size("gs://b/proc/1/job.stdout", 1) == 20
+    assert await lister.size("gs://b/proc/2/job.stdout", 1) is None
+    assert await lister.size("gs://b/proc/1/output/x.txt", 1) is None
+    assert store.calls == 1
+
+    store.sizes["gs://b/proc/0/job.stdout"] = 15
+    assert await lister.size("gs://b/proc/0/job.stdout", 2) == 15
+    assert store.calls == 2
+
+
+async def test_populate_skips_unchanged_objects():
+    """Test that objects not grown since the last read are not read."""
+    store = FakeStore({"gs://b/proc/0/job.stdout": 0})
+    mock_logfile = Mock()
+    mock_logfile.__str__ = Mock(return_value="gs://b/proc/0/job.stdout")
+    mock_logfile.a_exists = AsyncMock(return_value=True)
+
+    populator = LogsPopulator(lister=CloudJobLister(store, "gs://b/proc"))
+    populator.logfile = mock_logfile
+
+    assert await populator.populate(1) == []
+    store.sizes["gs://b/proc/1/job.stdout"] = 100
+    assert await populator.populate(2) == []
+    mock_logfile.a_exists.assert_not_called()
+    mock_logfile.a_open.assert_not_called()
+
+
+async def test_populate_falls_back_when_listing_fails():
+    """Test that the existence is checked when listing fails."""
+    store = FakeStore({})
+    store.list_sizes = AsyncMock(side_effect=PermissionError)
+    mock_logfile = Mock()
+    mock_logfile.a_exists = AsyncMock(return_value=False)
+
+    populator = LogsPopulator(lister=CloudJobLister(store, "gs://b/proc"))
+    populator.logfile = mock_logfile
+
+    assert await populator.populate(1) == []
+    assert populator.lister is None
+    mock_logfile.a_exists.assert_called_once()
+
+
+async def test_populate_checks_objects_below_min_jobs():
+    """Test that the objects are checked each with too few jobs tracked."""
+    store = FakeStore({"gs://b/proc/0/job.stdout": 0})
+    mock_logfile = Mock()
+    mock_logfile.__str__ = Mock(return_value="gs://b/proc/0/job.stdout")
+    mock_logfile.a_exists = AsyncMock(return_value=False)
+    lister = CloudJobLister(store, "gs://b/proc", min_jobs=2)
+    lister.jobs.add(0)
+    assert not lister.active
+
+    populator = LogsPopulator(lister=lister)
+    populator.logfile = mock_logfile
+    assert await populator.populate(1) == []
+    assert store.calls == 0
+    mock_logfile.a_exists.assert_called_once()
+
+    lister.jobs.add(1)
+    assert lister.active
+    assert await populator.populate(2) == []
+    assert store.calls == 1
+    mock_logfile.a_exists.assert_called_once()
+
+
+async def test_plugin_tracks_jobs(tmp_path):
+    """Test that the plugin tracks the registered jobs with the lister."""
+    plugin = PipenPoplogPlugin()
+    plugin.__init__()
+    plugin.scheduler = PopulatorScheduler(Mock(), Mock())
+    proc = Mock(size=3, plugin_opts=Diot(poplog_source="stdout"))
+    proc.name = "P"
+    jobs = [
+        Mock(
+            proc=proc,
+            index=i,
+            stdout_file=PanPath(f"gs://b/proc/{i}/job.stdout"),
+        )
+        for i in range(3)
+    ]
+    for job in jobs:
+        plugin._register(job)
+    lister = plugin.listers["P"]
+    assert lister.min_jobs == 8
+    assert lister.jobs == {0, 1, 2}
+
+    # the final sweep reads without listing
+    with patch.object(LogsPopulator, "populate", AsyncMock(return_value=[])):
+        await plugin._final_sweep(jobs[1])
+    assert lister.jobs == {0, 2}
+
+    proc.plugin_opts.poplog_cloud_batch = 2
+    plugin.listers.clear()
+    assert plugin._get_lister(proc, jobs[0].stdout_file).min_jobs == 2
+    plugin.__init__()
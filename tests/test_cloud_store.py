@@ -0,0 +1,286 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock, Mock
+from panpath import PanPath
+from pipen_poplog import (
+    CloudJobLister,
+    CloudObjectStore,
+    GSObjectStore,
+    LogsPopulator,
+    S3ObjectStore,
+    read_tail,
+)
+
+
+class LocalStore(CloudObjectStore):
+    """A fake object store backed by a local directory."""
+
+    def __init__(self, root):
+        self.root = root
+        self.requests = []
+
+    def _local(self, path):
+        return self.root / path.split("://", 1)[1]
+
+    async def list_sizes(self, prefix, names):
+        self.requests.append(("list", prefix))
+        return {
+            f"gs://{p.relative_to(self.root)}": p.stat().st_size
+            for p in self._local(prefix).rglob("*")
+            if p.name in names
+        }
+
+    async def read_range(self, path, start, end):
+        self.requests.append(("read", start, end))
+        local = self._local(path)
+        if not local.exists():
+            raise FileNotFoundError(path)
+        with local.open("rb") as f:
+            f.seek(start)
+            return f.read(end - start)
+
+    async def read_tail(self, path, nbytes):
+        self.requests.append(("tail", nbytes))
+        local = self._local(path)
+        if not local.exists():
+            raise FileNotFoundError(path)
+        return local.read_bytes()[-nbytes:]
+
+
+@pytest.fixture
+def store(tmp_path):
+    (tmp_path / "b" / "proc" / "0").mkdir(parents=True)
+    return LocalStore(tmp_path)
+
+
+def _logfile(path="gs://b/proc/0/job.stdout"):
+    logfile = Mock()
+    logfile.__str__ = Mock(return_value=path)
+    return logfile
+
+
+def test_store_cached_by_bucket():
+    """Test that the same store is used for the paths in a bucket."""
+    store = CloudObjectStore.for_path(PanPath("gs://bucket1/a/job.stdout"))
+    assert CloudObjectStore.for_path(PanPath("gs://bucket1/b/c")) is store
+    assert CloudObjectStore.for_path(PanPath("gs://bucket2/a")) is not store
+
+
+async def test_ranged_reads_from_last_position(store):
+    """Test that only the new bytes are requested at each poll."""
+    local = store.root / "b" / "proc" / "0" / "job.stdout"
+    populator = LogsPopulator(store=store)
+    populator.logfile = _logfile()
+
+    assert await populator.populate(0) == []
+    local.write_bytes(b"line1\npart")
+    assert await populator.populate(1) == ["line1"]
+    with local.open("ab") as f:
+        f.write(b"ial\nline3\n")
+    assert await populator.populate(2) == ["partial", "line3"]
+    assert store.requests[-1] == ("read", 10, 10 + populator.chunk_size)
+
+
+async def test_chunk_size_limits_reads_per_poll(store):
+    """Test that at most chunk_size bytes are read per poll."""
+    local = store.root / "b" / "proc" / "0" / "job.stdout"
+    local.write_bytes(b"a\nb\nc\nd\n")
+    populator = LogsPopulator(store=store, chunk_size=3)
+    populator.logfile = _logfile()
+
+    assert await populator.populate(0) == ["a"]
+    assert populator.residue == b"b"
+    # the final sweep reads until the end
+    assert await populator.populate(-1) == ["b", "c", "d"]
+
+
+async def test_ranged_reads_with_lister(store):
+    """Test that the listed sizes bound the ranges and skip the reads."""
+    local = store.root / "b" / "proc" / "0" / "job.stdout"
+    local.write_bytes(b"x\ny\n")
+    populator = LogsPopulator(
+        store=store,
+        lister=CloudJobLister(store, "gs://b/proc"),
+    )
+    populator.logfile = _logfile()
+
+    assert await populator.populate(1) == ["x", "y"]
+    assert store.requests == [("list", "gs://b/proc"), ("read", 0, 4)]
+    assert await populator.populate(2) == []
+    assert store.requests[-1] == ("list", "gs://b/proc")
+
+    # the final sweep reads until the end without listing
+    with local.open("ab") as f:
+        f.write(b"z\n")
+    assert await populator.populate(-1) == ["z"]
+    assert [req[0] for req in store.requests].count("list") == 2
+
+
+async def test_read_tail_with_suffix_range(store, monkeypatch):
+    """Test that the tail of a cloud file is read with a single request."""
+    monkeypatch.setitem(CloudObjectStore._stores, "gs://b", store)
+    local = store.root / "b" / "proc" / "0" / "job.stderr"
+    local.write_bytes(b"".join(b"line%d\n" % i for i in range(1000)))
+
+    lines = await read_tail(PanPath("gs://b/proc/0/job.stderr"), 2, 100)
+    assert lines == ["line998", "line999"]
+    # one more byte to tell if the first line is truncated
+    assert store.requests == [("tail", 101)]
+
+    local.write_bytes(b"aaa\nbbb\nccc\n")
+    lines = await read_tail(PanPath("gs://b/proc/0/job.stderr"), 5, 12)
+    assert lines == ["aaa", "bbb", "ccc"]
+    lines = await read_tail(PanPath("gs://b/proc/0/job.stderr"), 5, 11)
+    assert lines == ["bbb", "ccc"]
+    lines = await read_tail(PanPath("gs://b/proc/0/job.stderr"), 5, 8)
+    assert lines == ["bbb", "ccc"]
+    assert await read_tail(PanPath("gs://b/proc/1/job.stderr"), 2, 100) == []
+
+
+def test_abstract_store():
+    """Test that the store without the operations can't be created."""
+    with pytest.raises(TypeError):
+        CloudObjectStore(Mock())
+
+
+def _raw_store(store_class, raw_client):
+    """A store with the raw client of the mocked panpath client"""
+    client = Mock()
+    client._get_client = AsyncMock(return_value=raw_client)
+    client._parse_path = lambda path: tuple(path.split("://", 1)[1].split("/", 1))
+    return store_class(Mock(async_client=client))
+
+
+def _error(**attrs):
+    """An error of the raw clients, with the attributes to tell the cause"""
+    error = Exception("error")
+    for name, value in attrs.items():
+        setattr(error, name, value)
+    return error
+
+
+async def test_gs_list_sizes():
+    """Test that the objects are listed with the glob, page by page."""
+    pages = [
+        {
+            "items": [{"name": "proc/0/job.stdout", "size": "10"}],
+            "nextPageToken": "t1",
+        },
+        {"items": [{"name": "proc/1/job.stderr", "size": "20"}]},
+    ]
+    requested = []
+
+    async def list_objects(bucket, params):
+        assert bucket == "b"
+        # copied, as the params are updated in place for the next page
+        requested.append(dict(params))
+        return pages[len(requested) - 1]
+
+    storage = Mock(list_objects=list_objects)
+    store = _raw_store(GSObjectStore, storage)
+
+    sizes = await store.list_sizes("gs://b/proc", ("job.stdout", "job.stderr"))
+    assert sizes == {"gs://b/proc/0/job.stdout": 10, "gs://b/proc/1/job.stderr": 20}
+    assert requested[0] == {
+        "prefix": "proc/",
+        "matchGlob": "**/{job.stdout,job.stderr}",
+        "fields": "items(name,size),nextPageToken",
+    }
+    assert requested[1]["pageToken"] == "t1"
+
+
+async def test_gs_ranged_reads():
+    """Test that the ranges are requested by the Range headers."""
+    storage = Mock(download=AsyncMock(return_value=b"data"))
+    store = _raw_store(GSObjectStore, storage)
+
+    assert await store.read_range("gs://b/proc/0/job.stdout", 10, 20) == b"data"
+    storage.download.assert_awaited_with(
+        "b", "proc/0/job.stdout", headers={"Range": "bytes=10-19"}
+    )
+    assert await store.read_tail("gs://b/proc/0/job.stdout", 100) == b"data"
+    storage.download.assert_awaited_with(
+        "b", "proc/0/job.stdout", headers={"Range": "bytes=-100"}
+    )
+
+
+async def test_gs_errors():
+    """Test that the errors of the requests are mapped."""
+    storage = Mock(download=AsyncMock(side_effect=_error(status=404)))
+    store = _raw_store(GSObjectStore, storage)
+    with pytest.raises(FileNotFoundError):
+        await store.read_range("gs://b/proc/0/job.stdout", 0, 10)
+
+    storage.download.side_effect = _error(status=416)
+    assert await store.read_range("gs://b/proc/0/job.stdout", 10, 20) == b""
+
+    storage.download.side_effect = _error(status=403)
+    with pytest.raises(Exception, match="error"):
+        await store.read_tail("gs://b/proc/0/job.stdout", 10)
+
+
+async def test_s3_list_sizes():
+    """Test that the objects are listed by pages and filtered by names."""
+    pages = [
+        {"Contents": [{"Key": "proc/0/job.stdout", "Size": 10}]},
+        {
+            "Contents": [
+                {"Key": "proc/0/output/x.txt", "Size": 30},
+                {"Key": "proc/1/job.stderr", "Size": 20},
+            ]
+        },
+        {},
+    ]
+
+    async def paginate(**kwargs):
+        assert kwargs == {"Bucket": "b", "Prefix": "proc/"}
+        for page in pages:
+            yield page
+
+    paginator = Mock(paginate=paginate)
+    client = Mock(get_paginator=Mock(return_value=paginator))
+    store = _raw_store(S3ObjectStore, client)
+
+    sizes = await store.list_sizes("s3://b/proc/", ("job.stdout", "job.stderr"))
+    assert sizes == {"s3://b/proc/0/job.stdout": 10, "s3://b/proc/1/job.stderr": 20}
+    client.get_paginator.assert_called_once_with("list_objects_v2")
+
+
+async def test_s3_ranged_reads():
+    """Test that the ranges are requested by the Range parameters."""
+    body = MagicMock()
+    body.__aenter__.return_value.read = AsyncMock(return_value=b"data")
+    client = Mock(get_object=AsyncMock(return_value={"Body": body}))
+    store = _raw_store(S3ObjectStore, client)
+
+    assert await store.read_range("s3://b/proc/0/job.stdout", 10, 20) == b"data"
+    client.get_object.assert_awaited_with(
+        Bucket="b", Key="proc/0/job.stdout", Range="bytes=10-19"
+    )
+    assert await store.read_tail("s3://b/proc/0/job.stdout", 100) == b"data"
+    client.get_object.assert_awaited_with(
+        Bucket="b", Key="proc/0/job.stdout", Range="bytes=-100"
+    )
+    body.__aexit__.assert_awaited()
+
+
+async def test_s3_errors():
+    """Test that the errors of the requests are mapped."""
+    client = Mock(
+        get_object=AsyncMock(
+            side_effect=_error(response={"Error": {"Code": "NoSuchKey"}})
+        )
+    )
+    store = _raw_store(S3ObjectStore, client)
+    with pytest.raises(FileNotFoundError):
+        await store.read_range("s3://b/proc/0/job.stdout", 0, 10)
+
+    client.get_object.side_effect = _error(response={"Error": {"Code": "404"}})
+    with pytest.raises(FileNotFoundError):
+        await store.read_tail("s3://b/proc/0/job.stdout", 10)
+
+    client.get_object.side_effect = _error(response={"Error": {"Code": "InvalidRange"}})
+    assert await store.read_range("s3://b/proc/0/job.stdout", 10, 20) == b""
+
+    client.get_object.side_effect = _error()
+    with pytest.raises(Exception, match="error"):
+        await store.read_range("s3://b/proc/0/job.stdout", 0, 10)
@@ -0,0 +1,71 @@
+import gzip
+import zlib
+
+import pytest
+from pipen_poplog import LogsPopulator, StreamDecompressor
+
+
+def _chunks(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def test_detect():
+    """Test detecting the format from the magic bytes."""
+    assert StreamDecompressor.detect(b"\x1f\x8b\x08") == "gzip"
+    assert StreamDecompressor.detect(b"\x28\xb5\x2f\xfd") == "zstd"
+    assert StreamDecompressor.detect(b"(a") == "none"
+    assert StreamDecompressor.detect(b"\x1f") is None
+    assert StreamDecompressor.detect(b"(") is None
+    assert StreamDecompressor.detect(b"hello") == "none"
+
+
+def test_invalid_format():
+    """Test that an invalid format raises an error."""
+    with pytest.raises(ValueError):
+        StreamDecompressor("bz2")
+
+
+def test_gzip_in_chunks():
+    """Test decompressing gzip data chunk by chunk, across members."""
+    data = gzip.compress(b"line1\nline2\n") + gzip.compress(b"line3\n")
+    decompressor = StreamDecompressor()
+    out = b"".join(decompressor.decompress(chunk) for chunk in _chunks(data, 3))
+    assert decompressor.format == "gzip"
+    assert out == b"line1\nline2\nline3\n"
+
+
+def test_plain_pending_until_final():
+    """Test that ambiguous short plain data is released at the final chunk."""
+    decompressor = StreamDecompressor("auto")
+    assert decompressor.decompress(b"(") == b""
+    assert decompressor.decompress(b"a", final=True) == b"(a"
+    assert decompressor.decompress(b"b") == b"b"
+
+
+def test_zstd_in_chunks():
+    """Test decompressing zstd data chunk by chunk."""
+    zstandard = pytest.importorskip("zstandard")
+    data = zstandard.ZstdCompressor().compress(b"line1\nline2\n")
+    decompressor = StreamDecompressor()
+    out = b"".join(decompressor.decompress(chunk) for chunk in _chunks(data, 5))
+    assert decompressor.format == "zstd"
+    assert out == b"line1\nline2\n"
+
+
+async def test_populate_growing_gzip_file(tmp_path):
+    """Test populating a gzip file that is being written."""
+    logfile = tmp_path / "job.stdout"
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    with logfile.open("wb") as f:
+        f.write(compressor.compress(b"line1\nli"))
+        f.write(compressor.flush(zlib.Z_SYNC_FLUSH))
+
+    populator = LogsPopulator(str(logfile), compression="auto", start="end")
+    assert await populator.populate(0) == ["line1"]
+    assert populator.residue == b"li"
+
+    with logfile.open("ab") as f:
+        f.write(compressor.compress(b"ne2\nline3\n"))
+        f.write(compressor.flush())
+    assert await populator.populate(1) == ["line2", "line3"]
+    await populator.destroy()
@@ -0,0 +1,49 @@
+import logging
+import pytest  # noqa: F401
+from pipen_poplog import FlushPolicy
+
+
+class TestFlushPolicy:
+    """Test cases for the FlushPolicy class."""
+
+    def test_nothing_pending(self):
+        """Test that nothing is flushed without pending records."""
+        policy = FlushPolicy()
+        assert not policy.due(0)
+
+    def test_urgent_records(self):
+        """Test that urgent records make the flush due immediately."""
+        policy = FlushPolicy(urgent_level="warning")
+        policy.flushed()
+        policy.record(logging.INFO, 10)
+        assert not policy.due(60)
+        policy.record(logging.WARNING, 10)
+        policy.record(logging.ERROR, 10)
+        assert policy.due(60)
+
+        policy.flushed()
+        assert (policy.pending_records, policy.pending_bytes) == (0, 0)
+        assert not policy.urgent
+        assert not policy.due(60)
+
+    def test_batched_by_volume(self):
+        """Test that non-urgent records are flushed by count or bytes."""
+        policy = FlushPolicy(max_records=3, max_bytes=100)
+        policy.flushed()
+        policy.record(logging.INFO, 10)
+        policy.record(logging.INFO, 10)
+        assert not policy.due(60)
+        policy.record(logging.INFO, 10)
+        assert policy.due(60)
+
+        policy.flushed()
+        policy.record(logging.DEBUG, 100)
+        assert policy.due(60)
+
+    def test_batched_by_time(self):
+        """Test that non-urgent records are flushed after the interval."""
+        policy = FlushPolicy()
+        policy.flushed()
+        policy.record(logging.INFO, 10)
+        assert not policy.due(60)
+        assert policy.due(0)
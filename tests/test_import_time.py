@@ -0,0 +1,80 @@
+import os
+import re
+import subprocess
+import sys
+
+import pytest
+
+# The budget (in microseconds) of importing pipen_poplog on top of pipen,
+# generous enough to not be flaky on slow machines
+IMPORT_BUDGET_US = 50_000
+# The modules only needed by optional features or the CLI
+LAZY_MODULES = ("sqlite3", "logging.handlers", "pipen.cli", "zstandard")
+IMPORT_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$")
+
+
+def _importtime():
+    """Get the modules imported by pipen_poplog and their self time"""
+    env = os.environ.copy()
+    # Allow the bytecode to be cached, so that compiling is not measured
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    code = "import pipen.pluginmgr, pipen.utils; import pipen_poplog"
+    # warm up the bytecode cache
+    subprocess.run([sys.executable, "-c", code], env=env, check=True)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    modules = {}
+    # Everything before pipen.utils is imported by pipen itself
+    for line in reversed(proc.stderr.splitlines()):
+        matched = IMPORT_LINE.match(line)
+        if not matched:
+            continue
+        selftime, _, indent, name = matched.groups()
+        if not indent and name in ("pipen.utils", "pipen.pluginmgr"):
+            break
+        modules[name] = int(selftime)
+    return modules
+
+
+def test_import_time():
+    """Test that importing the plugin stays cheap and lazy"""
+    modules = _importtime()
+    assert "pipen_poplog" in modules
+    for name in LAZY_MODULES:
+        assert name not in modules, f"{name} is imported eagerly"
+
+    total = sum(modules.values())
+    assert total < IMPORT_BUDGET_US, (
+        f"Importing pipen_poplog took {total}us (budget {IMPORT_BUDGET_US}us): "
+        f"{modules}"
+    )
+
+
+def test_lazy_classes():
+    """Test that the lazily built classes are accessible from the module"""
+    import pipen_poplog
+
+    assert pipen_poplog.PoplogQueueHandler.__qualname__ == "PoplogQueueHandler"
+    assert pipen_poplog.PoplogCLIPlugin.name == "poplog"
+    assert "PoplogCLIPlugin" in vars(pipen_poplog)
+
+    with pytest.raises(AttributeError):
+        pipen_poplog.NoSuchAttribute
+
+
+def test_no_scheduler_at_import():
+    """Test that the populator machinery is not created at import time"""
+    subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import pipen_poplog; "
+            "assert pipen_poplog.poplog_plugin.scheduler is None",
+        ],
+        check=True,
+    )
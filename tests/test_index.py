@@ -0,0 +1,92 @@
+import logging
+from argparse import ArgumentParser, Namespace
+
+import pytest
+from pipen_poplog import LogsPopulator, PoplogCLIPlugin, PoplogIndex
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = PoplogIndex(tmp_path / PoplogIndex.FILENAME)
+    index.add("ProcA", 0, logging.INFO, "stdout", 0, "Loaded reference")
+    index.add("ProcA", 1, logging.WARNING, "stdout", 10, "100% done_x")
+    index.add("ProcB", 0, logging.ERROR, "stderr", None, "Failed")
+    yield index
+    index.close()
+
+
+def test_query(index):
+    """Test querying the messages."""
+    assert len(index.query()) == 3
+    assert [row[1] for row in index.query(proc="ProcA")] == [0, 1]
+    assert [row[6] for row in index.query(level="warning")] == [
+        "100% done_x",
+        "Failed",
+    ]
+    assert index.query(proc="ProcA", job=1)[0][5] == 10
+    assert len(index.query(search="100%")) == 1
+    assert len(index.query(search="0%")) == 1
+    assert index.query(search="e_")[0][6] == "100% done_x"
+    assert len(index.query(limit=2)) == 2
+
+
+def test_commit(tmp_path):
+    """Test that the messages are written only when committed."""
+    path = tmp_path / PoplogIndex.FILENAME
+    index = PoplogIndex(path)
+    reader = PoplogIndex(path)
+
+    index.commit()
+    index.add("P", 0, logging.INFO, "stdout", 0, "a")
+    index.add("P", 1, logging.INFO, "stdout", 0, "b")
+    assert reader.query() == []
+
+    index.commit()
+    assert index.pending == []
+    assert len(reader.query()) == 2
+
+    # reset at a new run
+    reset = PoplogIndex(path, reset=True)
+    assert reset.query() == []
+    for idx in (index, reader, reset):
+        idx.close()
+
+
+async def test_populator_offsets(tmp_path):
+    """Test that the offsets of the lines are tracked."""
+    logfile = tmp_path / "job.stdout"
+    logfile.write_bytes(b"ab\r\ncd\nef")
+
+    populator = LogsPopulator(str(logfile), track_offsets=True)
+    assert await populator.populate() == ["ab", "cd"]
+    assert populator.offsets == [0, 4]
+    assert populator.residue_offset == 7
+
+    with logfile.open("ab") as f:
+        f.write(b"g\nhi\n")
+    assert await populator.populate() == ["efg", "hi"]
+    assert populator.offsets == [7, 11]
+    await populator.destroy()
+
+
+def test_cli(index, tmp_path, capsys):
+    """Test the CLI to query the index."""
+    index.commit()
+    parser = ArgumentParser()
+    plugin = PoplogCLIPlugin(parser, ArgumentParser())
+    plugin.exec_command(
+        Namespace(
+            index=str(tmp_path),
+            proc="ProcA",
+            job=None,
+            level=None,
+            search=None,
+            limit=None,
+        )
+    )
+    out = capsys.readouterr().out.splitlines()
+    assert len(out) == 2
+    assert out[0].endswith("I ProcA[0] (stdout@0) Loaded reference")
+
+    with pytest.raises(FileNotFoundError):
+        plugin.exec_command(Namespace(index=str(tmp_path / "x")))
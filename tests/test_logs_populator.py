@@ -172,6 +172,60 @@ class TestLogsPopulator:
         assert populator.handler is None
         mock_handler.close.assert_called_once()
 
+    async def test_populate_start_at_end(self, tmp_path):
+        """Test that populating starts at the end of the file."""
+        logfile = tmp_path / "job.stdout"
+        logfile.write_text("old1\nold2\n")
+
+        populator = LogsPopulator(str(logfile), start="end")
+        assert await populator.populate() == []
+        with logfile.open("a") as f:
+            f.write("new\n")
+        assert await populator.populate() == ["new"]
+        await populator.destroy()
+
+    async def test_populate_start_at_last_lines(self, tmp_path):
+        """Test that populating starts at the last lines of the file."""
+        logfile = tmp_path / "job.stdout"
+        logfile.write_text("".join(f"line{i}\n" for i in range(10000)) + "part")
+
+        populator = LogsPopulator(str(logfile), start="2")
+        assert await populator.populate() == ["line9999"]
+        assert populator.residue == b"part"
+        await populator.destroy()
+
+    async def test_populate_start_waits_for_file(self, tmp_path):
+        """Test that the start is found when the file is first seen."""
+        logfile = tmp_path / "job.stdout"
+        populator = LogsPopulator(str(logfile), start=1)
+        assert await populator.populate() == []
+
+        logfile.write_text("a\nb\n")
+        assert await populator.populate() == ["b"]
+        await populator.destroy()
+
+    async def test_populate_keeps_recent_output(self, tmp_path):
+        """Test that the output read is kept in the ring buffer."""
+        logfile = tmp_path / "job.stdout"
+        logfile.write_text("a\nb\n")
+
+        populator = LogsPopulator(str(logfile), ring_bytes=4, ring_lines=1)
+        assert await populator.populate() == ["a", "b"]
+        with logfile.open("a") as f:
+            f.write("c\nd")
+        assert await populator.populate() == ["c"]
+        assert populator.ring.getvalue() == b"\nc\nd"
+        assert populator.ring.lines() == ["d"]
+        assert LogsPopulator().ring is None
+        await populator.destroy()
+
+    def test_invalid_start(self):
+        """Test that an invalid start raises an error."""
+        with pytest.raises(ValueError):
+            LogsPopulator(start="middle")
+        with pytest.raises(ValueError):
+            LogsPopulator(start=-1)
+
     def test_slots_attribute(self):
         """Test that the class uses __slots__ correctly."""
         populator = LogsPopulator()
@@ -0,0 +1,98 @@
+from unittest.mock import Mock
+
+import pytest
+from pipen_poplog import (
+    LogsPopulator,
+    OutputRing,
+    PipenPoplogPlugin,
+    PopulatorEntry,
+    PopulatorScheduler,
+)
+
+
+def test_invalid_size():
+    """Test that an invalid size raises an error."""
+    with pytest.raises(ValueError):
+        OutputRing(0)
+
+
+def test_not_full():
+    """Test that the written bytes are kept in order."""
+    ring = OutputRing(10)
+    ring.write(b"ab\n")
+    ring.write(b"cd\n")
+    assert ring.getvalue() == b"ab\ncd\n"
+    assert ring.lines() == ["ab", "cd"]
+
+
+def test_wrap_around():
+    """Test that the oldest bytes are overwritten."""
+    ring = OutputRing(8, nlines=2)
+    ring.write(b"line1\n")
+    ring.write(b"line2\n")
+    assert ring.getvalue() == b"e1\nline2\n"[-8:]
+    ring.write(b"3\n4\n5\n")
+    assert ring.getvalue() == b"e2\n3\n4\n5\n"[-8:]
+    assert len(ring.buffer) == 8
+    # the cut first line is dropped, and only the last 2 lines are returned
+    assert ring.lines() == ["4", "5"]
+
+
+def test_wrap_at_line_boundary():
+    """Test that the first line is kept if the wrap-around doesn't cut it."""
+    ring = OutputRing(8)
+    ring.write(b"abc\ndef\n")
+    assert ring.lines() == ["abc", "def"]
+
+    ring = OutputRing(8)
+    ring.write(b"x\nabc\ndef\n")
+    assert ring.lines() == ["abc", "def"]
+
+    ring = OutputRing(8)
+    ring.write(b"ab\n")
+    ring.write(b"cd\n")
+    ring.write(b"ef\n")
+    # b"b\ncd\nef\n"
+    assert ring.lines() == ["cd", "ef"]
+    ring.write(b"g\n")
+    assert ring.lines() == ["cd", "ef", "g"]
+    ring.write(b"hi\n")
+    assert ring.lines() == ["ef", "g", "hi"]
+
+
+def test_write_larger_than_size():
+    """Test that only the last bytes are kept for a large write."""
+    ring = OutputRing(4)
+    ring.write(b"x")
+    ring.write(b"abcdefgh")
+    assert ring.getvalue() == b"efgh"
+    ring.write(b"ij")
+    assert ring.getvalue() == b"ghij"
+
+
+def test_dump_output(tmp_path):
+    """Test that the recent output of the jobs are dumped."""
+    plugin = PipenPoplogPlugin()
+    scheduler = plugin.scheduler
+    plugin.scheduler = PopulatorScheduler(Mock(), Mock())
+    try:
+        job = Mock(index=1)
+        job.proc.name = "P"
+        populator = LogsPopulator(ring_bytes=100)
+        populator.ring.write(b"hello 100%\n")
+        plugin.scheduler.register(PopulatorEntry(job, populator, Mock(), 5.0))
+        job2 = Mock(index=2)
+        job2.proc.name = "P"
+        plugin.scheduler.register(PopulatorEntry(job2, LogsPopulator(), Mock(), 5.0))
+
+        dumpfile = tmp_path / "dump.txt"
+        assert plugin.dump_output(dumpfile) == 1
+        assert dumpfile.read_text() == (
+            "# P: [1]\nRecent output (1 line(s)):\n  hello 100%\n"
+        )
+
+        assert plugin.dump_output() == 1
+        job.log.assert_called_once()
+        assert "hello 100%%" in job.log.call_args[0][1]
+    finally:
+        plugin.scheduler = scheduler
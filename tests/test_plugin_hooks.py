@@ -0,0 +1,320 @@
+from pathlib import Path
+from unittest.mock import Mock
+
+import pytest
+from diot import Diot
+from panpath import PanPath
+from pipen_poplog import PipenPoplogPlugin
+
+LINES = (
+    "[PIPEN-POPLOG][INFO] hello\n"
+    "not a message\n"
+    "[PIPEN-POPLOG][WARNING] 50% done\n"
+)
+
+
+@pytest.fixture
+def pipen(request, tmp_path):
+    """A fake pipeline, with the plugin options parametrized indirectly"""
+    opts = Diot(getattr(request, "param", {}))
+    return Mock(config=Mock(plugin_opts=opts), workdir=tmp_path)
+
+
+@pytest.fixture
+async def plugin(pipen):
+    """The started plugin, with its state reset around the test"""
+    plugin = PipenPoplogPlugin()
+    plugin.__init__()
+    await plugin.on_init(pipen)
+    await plugin.on_start(pipen)
+    yield plugin
+    await plugin.on_complete(pipen, True)
+    plugin.__init__()
+
+
+def _proc(plugin, pipen, name="P", size=1, **opts):
+    """A fake proc with the plugin options on top of the pipeline ones"""
+    proc = Mock(size=size, plugin_opts=Diot(pipen.config.plugin_opts, **opts))
+    proc.name = name
+    plugin.on_proc_create(proc)
+    return proc
+
+
+def _job(proc, index, tmp_path, content=LINES):
+    """A fake job of the proc with the content in its stdout file"""
+    jobdir = tmp_path / proc.name / str(index)
+    jobdir.mkdir(parents=True)
+    (jobdir / "job.stdout").write_text(content)
+    return Mock(
+        proc=proc,
+        index=index,
+        stdout_file=PanPath(jobdir / "job.stdout"),
+        stderr_file=PanPath(jobdir / "job.stderr"),
+    )
+
+
+def _logged(job):
+    """The (level, message, limit) of the messages logged for the job"""
+    return [
+        (call.args[0], call.args[1], call.kwargs.get("limit"))
+        for call in job.log.call_args_list
+    ]
+
+
+async def test_sampled_job_high_index(plugin, pipen, tmp_path):
+    """Test that a sampled job is logged whatever its index is."""
+    proc = _proc(plugin, pipen, size=1000, poplog_sample=1000)
+    job = _job(proc, 500, tmp_path)
+    await plugin.on_job_started(job)
+    await plugin.on_job_succeeded(job)
+    assert _logged(job) == [(20, "hello", 500), (30, "50%% done", 500)]
+
+
+async def test_failed_job_not_sampled(plugin, pipen, tmp_path):
+    """Test that a failed job is logged even if it is not sampled."""
+    proc = _proc(plugin, pipen, size=1000, poplog_sample=1)
+    await plugin.on_job_started(_job(proc, 0, tmp_path))
+    sampler = plugin.samplers["P"]
+    index = next(i for i in range(100, 1000) if not sampler.sampled(i))
+    job = _job(proc, index, tmp_path)
+    await plugin.on_job_started(job)
+    assert ("P", index) not in plugin.scheduler.entries
+
+    await plugin.on_job_failed(job)
+    assert _logged(job) == [(20, "hello", index), (30, "50%% done", index)]
+
+
+async def test_poplog_jobs(plugin, pipen, tmp_path):
+    """Test that only the jobs in poplog_jobs are populated, whatever their
+    indexes are."""
+    proc = _proc(plugin, pipen, size=10, poplog_jobs=[7])
+    job0 = _job(proc, 0, tmp_path)
+    job7 = _job(proc, 7, tmp_path)
+    await plugin.on_job_started(job0)
+    await plugin.on_job_started(job7)
+    assert list(plugin.scheduler.entries) == [("P", 7)]
+
+    await plugin.on_job_succeeded(job0)
+    await plugin.on_job_succeeded(job7)
+    job0.log.assert_not_called()
+    assert _logged(job7) == [(20, "hello", 7), (30, "50%% done", 7)]
+
+
+async def test_first_job(plugin, pipen, tmp_path):
+    """Test that only the first started job is populated by default."""
+    proc = _proc(plugin, pipen, size=10)
+    job2 = _job(proc, 2, tmp_path)
+    job1 = _job(proc, 1, tmp_path)
+    await plugin.on_job_started(job2)
+    await plugin.on_job_started(job1)
+    assert list(plugin.scheduler.entries) == [("P", 2)]
+
+    await plugin.on_job_succeeded(job2)
+    assert _logged(job2) == [(20, "hello", 3), (30, "50%% done", 3)]
+
+
+async def test_start_complete(pipen):
+    """Test that the scheduler is created at start and dropped at complete."""
+    plugin = PipenPoplogPlugin()
+    plugin.__init__()
+    pipen.config.plugin_opts.poplog_poll_interval = 2.0
+    await plugin.on_init(pipen)
+    assert plugin.scheduler is None
+
+    await plugin.on_start(pipen)
+    scheduler = plugin.scheduler
+    assert scheduler.interval == 2.0
+    assert scheduler.max_steps == 4
+    assert scheduler.task is not None
+
+    await plugin.on_complete(pipen, True)
+    assert plugin.scheduler is None
+    assert scheduler.task is None
+    # nothing to populate after the pipeline is done
+    proc = _proc(plugin, pipen)
+    job = _job(proc, 0, Path(pipen.workdir))
+    await plugin.on_job_started(job)
+    await plugin.on_job_succeeded(job)
+    job.log.assert_not_called()
+    plugin.__init__()
+
+
+@pytest.mark.parametrize("pipen", [{"poplog_index": True}], indirect=True)
+async def test_lifecycle(plugin, pipen, tmp_path):
+    """Test that a job is populated in the cycles and the final sweep."""
+    # run the cycles manually
+    await plugin.scheduler.stop()
+    proc = _proc(plugin, pipen)
+    job = _job(proc, 0, tmp_path, "[PIPEN-POPLOG][INFO] hello\n")
+    await plugin.on_job_started(job)
+    assert list(plugin.scheduler.entries) == [("P", 0)]
+
+    await plugin.scheduler.run_cycle()
+    job.log.assert_not_called()
+    await plugin.scheduler.run_cycle()
+    assert _logged(job) == [(20, "hello", 3)]
+
+    with open(tmp_path / "P" / "0" / "job.stdout", "a") as f:
+        f.write("[PIPEN-POPLOG][WARNING] more\n[PIPEN-POPLOG][ERROR] tail")
+    await plugin.scheduler.run_cycle()
+    assert _logged(job)[1:] == [(30, "more", 3)]
+    # committed at the end of the cycle
+    assert [row[6] for row in plugin.index.query()] == ["hello", "more"]
+
+    # the residue (no newline at the end) is populated by the final sweep
+    await plugin.on_job_succeeded(job)
+    assert _logged(job)[2:] == [(40, "tail", 3)]
+    assert plugin.scheduler.entries == {}
+
+    await plugin.on_proc_done(proc, True)
+    assert [row[6] for row in plugin.index.query()] == ["hello", "more", "tail"]
+    assert "P" not in plugin.matchers
+
+
+async def test_end_cycle_flush(plugin, pipen, tmp_path):
+    """Test that the handlers are flushed at the end of a cycle when due."""
+    await plugin.scheduler.stop()
+    handler = Mock()
+    plugin.flushing_handlers.add(handler)
+    proc = _proc(plugin, pipen, poplog_flush_interval=0)
+    job = _job(proc, 0, tmp_path)
+    await plugin.on_job_started(job)
+
+    await plugin.scheduler.run_cycle()
+    # nothing pending
+    handler.stream.flush.assert_not_called()
+    await plugin.scheduler.run_cycle()
+    handler.stream.flush.assert_called_once()
+
+
+async def test_killed_job(plugin, pipen, tmp_path):
+    """Test that a killed job without the stdout file is swept quietly."""
+    proc = _proc(plugin, pipen)
+    job = _job(proc, 0, tmp_path)
+    await plugin.on_job_started(job)
+    (tmp_path / "P" / "0" / "job.stdout").unlink()
+    await plugin.on_job_killed(job)
+    job.log.assert_not_called()
+    assert plugin.scheduler.entries == {}
+
+
+async def test_proc_done_unregister(plugin, pipen, tmp_path):
+    """Test that the jobs left are unregistered when the proc is done."""
+    proc = _proc(plugin, pipen, size=2, poplog_jobs=[0, 1])
+    other = _proc(plugin, pipen, name="Q")
+    for job in (_job(proc, 0, tmp_path), _job(proc, 1, tmp_path)):
+        await plugin.on_job_started(job)
+    await plugin.on_job_started(_job(other, 0, tmp_path))
+
+    await plugin.on_proc_done(proc, False)
+    assert list(plugin.scheduler.entries) == [("Q", 0)]
+
+
+async def test_aggregate(plugin, pipen, tmp_path):
+    """Test that the messages of the jobs are aggregated by their templates and
+    summarized when the proc is done."""
+    proc = _proc(plugin, pipen, size=2, poplog_jobs=[0, 1], poplog_aggregate=2)
+    jobs = [
+        _job(
+            proc,
+            i,
+            tmp_path,
+            "".join(
+                f"[PIPEN-POPLOG][INFO] Loaded /data/{i}.bam in {i}.{j}s\n"
+                for j in range(3)
+            )
+            + f"[PIPEN-POPLOG][WARNING] Job {i} is slow\n",
+        )
+        for i in range(2)
+    ]
+    for job in jobs:
+        await plugin.on_job_started(job)
+    for job in jobs:
+        await plugin.on_job_succeeded(job)
+
+    # only the first 2 messages of each template are logged, from any jobs
+    assert _logged(jobs[0]) == [
+        (20, "Loaded /data/0.bam in 0.0s", 0),
+        (20, "Loaded /data/0.bam in 0.1s", 0),
+        (30, "Job 0 is slow", 0),
+    ]
+    assert _logged(jobs[1]) == [(30, "Job 1 is slow", 1)]
+
+    await plugin.on_proc_done(proc, True)
+    proc.log.assert_called_once()
+    level, summary = proc.log.call_args[0]
+    assert level == "info"
+    assert summary.splitlines() == [
+        "Message summary (8 message(s), 2 template(s)):",
+        "  LEVEL    COUNT  TEMPLATE",
+        "  WARNING      2  Job <number> is slow",
+        "  INFO         6  Loaded <path> in <number>s",
+    ]
+    assert "P" not in plugin.aggregators
+
+
+async def test_aggregate_nothing_hidden(plugin, pipen, tmp_path):
+    """Test that no summary is logged when all the messages are logged."""
+    proc = _proc(plugin, pipen, poplog_aggregate=True)
+    job = _job(proc, 0, tmp_path)
+    await plugin.on_job_started(job)
+    await plugin.on_job_succeeded(job)
+    assert _logged(job) == [(20, "hello", 0), (30, "50%% done", 0)]
+
+    await plugin.on_proc_done(proc, True)
+    proc.log.assert_not_called()
+
+
+async def test_sample(plugin, pipen, tmp_path):
+    """Test that the sampled jobs and the ones in poplog_jobs are populated."""
+    proc = _proc(plugin, pipen, size=100, poplog_sample=10, poplog_jobs=[99])
+    for i in range(100):
+        await plugin.on_job_started(_job(proc, i, tmp_path))
+    sampler = plugin.samplers["P"]
+    assert sorted(plugin.scheduler.entries) == sorted(
+        {("P", i) for i in range(100) if sampler.sampled(i)} | {("P", 99)}
+    )
+    assert len(plugin.scheduler.entries) == 10 + (not sampler.sampled(99))
+    assert all(entry.selected for entry in plugin.scheduler.entries.values())
+
+    await plugin.on_proc_done(proc, True)
+    assert plugin.scheduler.entries == {}
+    assert "P" not in plugin.samplers
+
+
+async def test_sample_adapt(plugin, pipen, tmp_path):
+    """Test that the sample rate is adapted to the cost at the end of a cycle."""
+    proc = _proc(plugin, pipen, size=1000, poplog_sample=0.5, poplog_sample_budget=1)
+    job = _job(proc, 0, tmp_path)
+    plugin._register(job, selected=True)
+    entry = plugin.scheduler.entries[("P", 0)]
+    sampler = plugin._get_sampler(proc)
+
+    entry.cost = 0.6
+    plugin._end_cycle([entry, entry])
+    assert sampler.scale == 0.5
+    started = [i for i in range(1, 1000) if sampler.sampled(i)]
+    assert 0 < len(started) < 400
+
+    entry.cost = 0.1
+    plugin._end_cycle([entry])
+    assert sampler.scale == 0.625
+
+
+async def test_max_hit_selected_job(plugin, pipen, tmp_path):
+    """Test that the max-hit warning of a selected job is logged whatever its
+    index is."""
+    await plugin.scheduler.stop()
+    proc = _proc(plugin, pipen, size=10, poplog_jobs=[7], poplog_max=1)
+    job = _job(proc, 7, tmp_path, "[PIPEN-POPLOG][INFO] hello\n")
+    await plugin.on_job_started(job)
+    await plugin.scheduler.run_cycle()
+    await plugin.scheduler.run_cycle()
+
+    with open(tmp_path / "P" / "7" / "job.stdout", "a") as f:
+        f.write("[PIPEN-POPLOG][INFO] more\n")
+    await plugin.on_job_succeeded(job)
+    assert _logged(job) == [
+        (20, "hello", 7),
+        ("warning", "Max messages reached (1), check stdout/stderr files for more.", 7),
+    ]
@@ -0,0 +1,135 @@
+import logging
+import pytest
+from pipen_poplog import PATTERN, PoplogMatcher, PoplogRule, logger
+
+
+@pytest.fixture(autouse=True)
+def loglevel():
+    """Set the level of the poplog logger for the tests."""
+    base_logger = logger.logger
+    level = base_logger.level
+    base_logger.setLevel(logging.DEBUG)
+    yield
+    base_logger.setLevel(level)
+
+
+class TestPoplogMatcher:
+    """Test cases for the PoplogMatcher class."""
+
+    def test_default_pattern(self):
+        """Test matching with the default pattern."""
+        matcher = PoplogMatcher([PATTERN])
+        rule, level, msg = matcher.match("[PIPEN-POPLOG][WARN] hello  ")
+        assert rule.logger is logger
+        assert level == logging.WARNING
+        assert msg == "hello"
+        assert matcher.match("not a poplog line") is None
+
+    def test_dispatch_to_rules(self):
+        """Test that lines are dispatched to the rule they match."""
+        matcher = PoplogMatcher(
+            [
+                PATTERN,
+                {"pattern": r"progress: (?P<message>\d+%)", "level": "debug"},
+                {"pattern": r"METRIC (?P<message>.*)", "logger": "metrics"},
+                {"pattern": r"NOISE", "drop": True},
+            ]
+        )
+        assert matcher.regex.groups == 8
+
+        rule, level, msg = matcher.match("progress: 50%")
+        assert rule is matcher.rules[1]
+        assert (level, msg) == (logging.DEBUG, "50%")
+
+        rule, level, msg = matcher.match("METRIC auc=0.9")
+        assert rule.logger.logger.name == "pipen.metrics"
+        assert (level, msg) == (logging.INFO, "auc=0.9")
+
+        assert matcher.match("NOISE here") is None
+
+    def test_force_level(self):
+        """Test that force_level overrides the captured level."""
+        matcher = PoplogMatcher(
+            [{"pattern": PATTERN, "level": "ERROR", "force_level": True}]
+        )
+        _, level, msg = matcher.match("[PIPEN-POPLOG][INFO] boom")
+        assert (level, msg) == (logging.ERROR, "boom")
+
+    def test_named_backreference(self):
+        """Test that named backreferences are renamed with the groups."""
+        matcher = PoplogMatcher(
+            [r"(?P<q>['\"])(?P<message>.*)(?P=q)", r"(?P<q>\d)(?P=q)"]
+        )
+        assert matcher.match("'quoted'")[2] == "quoted"
+        assert matcher.match("11")[0] is matcher.rules[1]
+        assert matcher.match("12") is None
+
+    def test_single_rule_unwrapped(self):
+        """Test that a single rule is compiled as is."""
+        matcher = PoplogMatcher([r"(?i)\[poplog\]\[(?P<level>\w+)\] (?P<message>.*)"])
+        assert matcher.regex.groups == 2
+        _, level, msg = matcher.match("[POPLOG][warn] hi")
+        assert (level, msg) == (logging.WARNING, "hi")
+
+        matcher = PoplogMatcher([r"(a)(b)\2"])
+        assert matcher.match("abb")[2] == "abb"
+        assert matcher.match("abc") is None
+
+    def test_global_flags_scoped(self):
+        """Test that the leading global flags are scoped to the rule."""
+        matcher = PoplogMatcher([r"(?i)loud (?P<message>.*)", r"quiet (?P<message>.*)"])
+        assert matcher.match("LOUD a")[2] == "a"
+        assert matcher.match("quiet b")[2] == "b"
+        assert matcher.match("QUIET c") is None
+
+    def test_invalid_rules(self):
+        """Test that the unsupported patterns with multiple rules raise errors."""
+        with pytest.raises(ValueError, match="poplog_rules.*backreferences"):
+            PoplogMatcher([r"(a)(b)\2", PATTERN])
+        with pytest.raises(ValueError, match="poplog_rules.*conditional"):
+            PoplogMatcher([r"(<)?x(?(1)>)", PATTERN])
+
+    def test_conditional_groups(self):
+        """Test that the named conditional groups are renamed with the groups."""
+        matcher = PoplogMatcher(
+            [r"(?P<q>\()?(?P<message>\w+)(?(q)\))$", r"(?P<message>-.*)"]
+        )
+        assert matcher.match("(abc)")[2] == "abc"
+        assert matcher.match("abc")[2] == "abc"
+        assert matcher.match("(abc") is None
+        assert matcher.match("-x")[2] == "-x"
+
+    def test_character_classes_escapes(self):
+        """Test that the group syntax in character classes or escaped is kept."""
+        matcher = PoplogMatcher(
+            [r"[(?P<x>\]]+ (?P<message>.*)", r"\(?P<y> (?P<message>.*)", PATTERN]
+        )
+        assert matcher.regex.pattern.count("(?P<_r0_message>") == 1
+        assert matcher.match("?<]x a")[2] == "a"
+        assert matcher.match("(P<y> b")[2] == "b"
+        assert matcher.match("P<y> c")[2] == "c"
+        assert matcher.match("[PIPEN-POPLOG][INFO] d")[2] == "d"
+        # \1 in a character class is an octal escape, not a backreference
+        assert PoplogMatcher([r"[\1](?P<message>.*)", PATTERN]).match("\1e")[2] == "e"
+
+    def test_rule_from_spec(self):
+        """Test creating rules from different specs."""
+        rule = PoplogRule("x")
+        assert PoplogRule.from_spec(rule) is rule
+        assert PoplogRule.from_spec("y").pattern == "y"
+        assert PoplogRule.from_spec({"pattern": "z", "level": "WARN"}).level == "warn"
+
+    def test_level_threshold(self):
+        """Test that lines below the level of the logger are filtered."""
+        logger.logger.setLevel(logging.WARNING)
+        matcher = PoplogMatcher([PATTERN])
+        assert matcher.match("[PIPEN-POPLOG][INFO] quiet") is None
+        assert matcher.match("[PIPEN-POPLOG][ERROR] loud")[1] == logging.ERROR
+
+    def test_custom_and_unknown_levels(self):
+        """Test custom levels are resolved and unknown ones fall back."""
+        logging.addLevelName(25, "NOTICE")
+        matcher = PoplogMatcher([PATTERN, {"pattern": "(?P<level>x+)", "level": "debug"}])
+        assert matcher.match("[PIPEN-POPLOG][notice] a")[1] == 25
+        assert matcher.match("[PIPEN-POPLOG][whatever] a")[1] == logging.INFO
+        assert matcher.match("xx")[1] == logging.DEBUG
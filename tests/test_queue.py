@@ -0,0 +1,102 @@
+import logging
+import time
+from queue import Queue
+from unittest.mock import Mock
+
+import pytest
+from pipen_poplog import PoplogQueueHandler, PoplogQueueListener
+
+
+def _record(msg, name="pipen.poplog-test", level=logging.INFO):
+    return logging.makeLogRecord({"msg": msg, "name": name, "levelno": level})
+
+
+class TestPoplogQueueHandler:
+    """Test cases for the PoplogQueueHandler class."""
+
+    def test_invalid_overflow(self):
+        """Test that an invalid overflow policy raises an error."""
+        with pytest.raises(ValueError):
+            PoplogQueueHandler(Queue(1), "block")
+
+    def test_drop_new(self):
+        """Test that new records are dropped when the queue is full."""
+        handler = PoplogQueueHandler(Queue(2), "drop")
+        for i in range(4):
+            handler.emit(_record(f"msg{i}"))
+
+        assert handler.dropped == 2
+        assert [handler.queue.get().msg for _ in range(2)] == ["msg0", "msg1"]
+
+    def test_drop_oldest(self):
+        """Test that the oldest records are dropped when the queue is full."""
+        handler = PoplogQueueHandler(Queue(2), "drop_oldest")
+        for i in range(4):
+            handler.emit(_record(f"msg{i}"))
+
+        assert handler.dropped == 2
+        assert [handler.queue.get().msg for _ in range(2)] == ["msg2", "msg3"]
+
+
+class TestPoplogQueueListener:
+    """Test cases for the PoplogQueueListener class."""
+
+    def test_attach_route_and_detach(self):
+        """Test that records are emitted by the original handlers."""
+        log = logging.getLogger("pipen.poplog-test")
+        origin = Mock(level=logging.WARNING)
+        log.handlers = [origin]
+        log.setLevel(logging.DEBUG)
+
+        listener = PoplogQueueListener(10)
+        listener.attach(log)
+        listener.attach(log)
+        assert log.handlers == [listener.queue_handler]
+
+        listener.start()
+        log.info("info")
+        log.error("error")
+        listener.stop()
+
+        assert origin.handle.call_count == 1
+        assert origin.handle.call_args[0][0].getMessage() == "error"
+
+        listener.detach_all()
+        assert log.handlers == [origin]
+        log.handlers = []
+
+    def test_request_flush(self):
+        """Test that flush requests flush the flushing handlers."""
+        handler = Mock()
+        handler.stream.fileno.side_effect = OSError
+        listener = PoplogQueueListener(1, flushing_handlers=[handler])
+        listener.request_flush()
+        # queue is full, the request is ignored
+        listener.request_flush()
+
+        listener.start()
+        listener.stop()
+        handler.stream.flush.assert_called_once()
+
+    def test_stop_full_queue(self):
+        """Test that stopping waits for the slow handlers to drain a full queue."""
+        log = logging.getLogger("pipen.poplog-test")
+        origin = Mock(level=logging.INFO)
+        origin.handle.side_effect = lambda record: time.sleep(0.05)
+        log.handlers = [origin]
+        log.setLevel(logging.DEBUG)
+
+        listener = PoplogQueueListener(3)
+        listener.attach(log)
+        listener.start()
+        for i in range(6):
+            log.info("msg%s", i)
+        # still full while the first records are being handled
+        assert listener.queue.full()
+
+        listener.stop()
+        assert listener._thread is None
+        assert origin.handle.call_count == 6 - listener.queue_handler.dropped
+        listener.detach_all()
+        assert log.handlers == [origin]
+        log.handlers = []
@@ -0,0 +1,89 @@
+import pytest  # noqa: F401
+from pipen_poplog import find_tail_offset, read_tail
+
+
+def _reader(content):
+    async def read_at(start, end):
+        return content[start:end]
+
+    return read_at
+
+
+async def test_read_tail_lines(tmp_path):
+    """Test reading the last lines of a large file."""
+    path = tmp_path / "job.stderr"
+    path.write_text("".join(f"line{i}\n" for i in range(10000)))
+
+    assert await read_tail(path, 3, 8192, block_size=7) == [
+        "line9997",
+        "line9998",
+        "line9999",
+    ]
+
+
+async def test_read_tail_capped_by_bytes(tmp_path):
+    """Test that at most max_bytes are read and truncated lines dropped."""
+    path = tmp_path / "job.stderr"
+    path.write_text("".join(f"line{i}\n" for i in range(10000)))
+
+    assert await read_tail(str(path), 10, 20) == ["line9998", "line9999"]
+
+
+async def test_read_tail_exactly_max_bytes(tmp_path):
+    """Test that the first line is kept when read from the start of the file."""
+    path = tmp_path / "job.stderr"
+    path.write_text("aaa\nbbb\nccc\n")
+
+    assert await read_tail(path, 5, 12) == ["aaa", "bbb", "ccc"]
+    assert await read_tail(path, 5, 11) == ["bbb", "ccc"]
+    # the window starts right after a newline
+    assert await read_tail(path, 5, 8) == ["bbb", "ccc"]
+
+
+async def test_read_tail_small_file(tmp_path):
+    """Test reading a file with fewer lines than requested."""
+    path = tmp_path / "job.stderr"
+    path.write_text("a\nb")
+
+    assert await read_tail(path, 5, 8192) == ["a", "b"]
+
+
+async def test_read_tail_nonexistent_file(tmp_path):
+    """Test reading a file that doesn't exist."""
+    assert await read_tail(tmp_path / "job.stderr", 5, 8192) == []
+
+
+@pytest.mark.parametrize(
+    "content,nlines,expected",
+    [
+        (b"a\nb\nc\n", 0, 6),
+        (b"a\nb\nc\n", 1, 4),
+        (b"a\nb\nc\n", 2, 2),
+        (b"a\nb\nc\n", 5, 0),
+        (b"a\nb\nc", 1, 4),
+        (b"a\nb\nc", 2, 2),
+        (b"", 3, 0),
+    ],
+)
+async def test_find_tail_offset(content, nlines, expected):
+    """Test finding the offset of the last lines."""
+    offset = await find_tail_offset(
+        _reader(content),
+        len(content),
+        nlines,
+        block_size=3,
+    )
+    assert offset == expected
+
+
+async def test_find_tail_offset_capped_by_bytes():
+    """Test that the first complete line in the scanned bytes is used."""
+    content = b"".join(b"line%d\n" % i for i in range(1000))
+    offset = await find_tail_offset(
+        _reader(content),
+        len(content),
+        100,
+        max_bytes=20,
+        block_size=7,
+    )
+    assert content[offset:] == b"line998\nline999\n"
@@ -0,0 +1,64 @@
+import pytest
+from pipen_poplog import JobSampler
+
+
+@pytest.mark.parametrize("sample", [0, 1.0, 1.5, -1, True, "10"])
+def test_invalid_sample(sample):
+    """Test that an invalid sample raises an error."""
+    with pytest.raises(ValueError):
+        JobSampler("P", 10, sample)
+
+
+def test_key_deterministic():
+    """Test that the keys are deterministic and differ across procs."""
+    assert JobSampler.key("P", 1) == JobSampler.key("P", 1)
+    assert JobSampler.key("P", 1) != JobSampler.key("Q", 1)
+    assert 0 <= JobSampler.key("P", 1) < 1
+
+
+def test_sample_fraction():
+    """Test that about the fraction of the jobs are sampled."""
+    sampler = JobSampler("P", 10000, 0.1)
+    sampled = [i for i in range(10000) if sampler.sampled(i)]
+    assert 800 < len(sampled) < 1200
+    assert sampled == [i for i in range(10000) if sampler.sampled(i)]
+
+
+def test_sample_count():
+    """Test that exactly the number of the jobs are sampled."""
+    sampler = JobSampler("P", 500, 20)
+    assert sum(sampler.sampled(i) for i in range(500)) == 20
+
+    sampler = JobSampler("P", 5, 20)
+    assert all(sampler.sampled(i) for i in range(5))
+
+
+def test_adapt():
+    """Test that the rate is adapted to the cost."""
+    sampler = JobSampler("P", 1000, 0.5, budget=1.0)
+    before = {i for i in range(1000) if sampler.sampled(i)}
+
+    sampler.adapt(2.0)
+    assert sampler.scale == 0.5
+    after = {i for i in range(1000) if sampler.sampled(i)}
+    # only dropping jobs from the sample
+    assert after < before
+
+    sampler.adapt(0.8)
+    assert sampler.scale == 0.5
+    sampler.adapt(0.1)
+    assert sampler.scale == 0.625
+
+    for _ in range(100):
+        sampler.adapt(10)
+    assert sampler.scale == JobSampler.MIN_SCALE
+    for _ in range(100):
+        sampler.adapt(0)
+    assert sampler.scale == 1.0
+
+
+def test_adapt_disabled():
+    """Test that the rate is not adapted without a budget."""
+    sampler = JobSampler("P", 10, 0.5)
+    sampler.adapt(100)
+    assert sampler.scale == 1.0
@@ -0,0 +1,139 @@
+import asyncio
+from unittest.mock import Mock
+
+import pytest  # noqa: F401
+from pipen_poplog import PopulatorEntry, PopulatorScheduler
+
+
+def _entry(index, proc="P"):
+    job = Mock(index=index)
+    job.proc.name = proc
+    return PopulatorEntry(job, Mock(), Mock(), 5.0)
+
+
+class _Visits:
+    """Record the visits and return the given number of bytes"""
+
+    def __init__(self, nbytes=None):
+        self.nbytes = nbytes or {}
+        self.visits = []
+        self.ended = []
+
+    async def visit(self, entry, cycle):
+        self.visits.append((entry.key[1], cycle))
+        nbytes = self.nbytes.get(entry.key[1], 0)
+        if isinstance(nbytes, Exception):
+            raise nbytes
+        return nbytes
+
+    def end_cycle(self, visited):
+        self.ended.append([entry.key[1] for entry in visited])
+
+
+async def test_first_visit_delayed():
+    """Test that a job is visited one interval after registered."""
+    visits = _Visits()
+    scheduler = PopulatorScheduler(visits.visit, visits.end_cycle)
+    scheduler.register(_entry(0))
+    await scheduler.run_cycle()
+    assert visits.visits == []
+    await scheduler.run_cycle()
+    assert visits.visits == [(0, 2)]
+    assert visits.ended == [[], [0]]
+
+
+async def test_active_first_and_bytes_budget():
+    """Test that the active jobs are visited first within the budget."""
+    visits = _Visits({0: 10, 1: 100})
+    scheduler = PopulatorScheduler(
+        visits.visit,
+        visits.end_cycle,
+        cycle_bytes=100,
+    )
+    for i in range(3):
+        scheduler.register(_entry(i))
+    scheduler.cycle = 1
+    await scheduler.run_cycle()
+    assert visits.visits == [(0, 2), (1, 2)]
+    # 2 is left from cycle 2, so it goes first
+    await scheduler.run_cycle()
+    assert visits.visits[2:] == [(2, 3), (1, 3)]
+    # 0 is left from cycle 3, then 1 is more active than 2
+    await scheduler.run_cycle()
+    assert visits.visits[4:] == [(0, 4), (1, 4)]
+
+
+async def test_idle_backoff():
+    """Test that the idle jobs back off up to the max interval."""
+    visits = _Visits()
+    scheduler = PopulatorScheduler(
+        visits.visit,
+        visits.end_cycle,
+        interval=1.0,
+        max_interval=4.0,
+    )
+    scheduler.register(_entry(0))
+    for _ in range(16):
+        await scheduler.run_cycle()
+    assert [cycle for _, cycle in visits.visits] == [2, 4, 8, 12, 16]
+
+
+async def test_unregister():
+    """Test that the unregistered jobs are not visited."""
+    visits = _Visits()
+    scheduler = PopulatorScheduler(visits.visit, visits.end_cycle)
+    entry = _entry(0)
+    scheduler.register(entry)
+    assert await scheduler.unregister(entry.key) is entry
+    assert await scheduler.unregister(entry.key) is None
+    # registered again, the stale item in the heap is skipped
+    scheduler.register(_entry(0))
+    for _ in range(3):
+        await scheduler.run_cycle()
+    assert visits.visits == [(0, 2)]
+
+
+async def test_visit_error():
+    """Test that an error is logged once and the job is kept."""
+    visits = _Visits({0: RuntimeError("boom")})
+    scheduler = PopulatorScheduler(visits.visit, visits.end_cycle, max_interval=1)
+    entry = _entry(0)
+    scheduler.register(entry)
+    for _ in range(4):
+        await scheduler.run_cycle()
+    assert len(visits.visits) == 3
+    assert entry.errors == 3
+    entry.job.log.assert_called_once()
+    assert "boom" in entry.job.log.call_args[0][1]
+
+
+async def test_end_cycle_error():
+    """Test that the cycles keep running when ending a cycle fails."""
+    visits = _Visits()
+    end_cycle = Mock(side_effect=RuntimeError("boom"))
+    scheduler = PopulatorScheduler(visits.visit, end_cycle, max_interval=1)
+    scheduler.register(_entry(0))
+    for _ in range(4):
+        await scheduler.run_cycle()
+    assert [cycle for _, cycle in visits.visits] == [2, 3, 4]
+    assert end_cycle.call_count == 4
+    assert scheduler.errors == 4
+
+
+async def test_start_stop():
+    """Test that the cycles are run by the task."""
+    visits = _Visits({0: 1})
+    scheduler = PopulatorScheduler(
+        visits.visit,
+        visits.end_cycle,
+        interval=0.01,
+    )
+    scheduler.register(_entry(0))
+    scheduler.start()
+    await asyncio.sleep(0.1)
+    await scheduler.stop()
+    assert scheduler.task is None
+    assert len(visits.visits) >= 3
+    count = len(visits.visits)
+    await asyncio.sleep(0.05)
+    assert len(visits.visits) == count